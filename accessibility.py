@@ -0,0 +1,202 @@
+import sys
+from abc import ABC, abstractmethod
+from threading import Lock
+
+from matcher import ElementMatcher
+from regions import overlaps
+from tracing import tracer
+
+ICON_ROLES = {"button", "pushbutton", "togglebutton", "splitbutton", "menubutton", "checkbox", "radiobutton", "image", "icon"}
+CONTAINER_ROLES = {"window", "frame", "pane", "panel", "application", "filler", "desktopframe"}
+
+class Provider(ABC):
+    """Source of the platform's UI element tree."""
+
+    @abstractmethod
+    def windows(self) -> list[tuple[object, tuple[int, int, int, int]]]:
+        """Visible top-level windows, front to back, as (key, rect in screen pixels). Called on every lookup, so it must be cheap."""
+
+    @abstractmethod
+    def elements(self, key) -> list[dict]:
+        """Named controls of one window as {"name", "role", "rect"} dicts in screen pixels."""
+
+class UIAutomationProvider(Provider):
+
+    def __init__(self, max_depth: int = 16, max_elements: int = 2000) -> None:
+        import uiautomation, win32gui
+        self.__automation, self.__gui = uiautomation, win32gui
+        self.__max_depth = max_depth
+        self.__max_elements = max_elements
+
+    def windows(self) -> list[tuple[int, tuple[int, int, int, int]]]:
+        handles = []
+        self.__gui.EnumWindows(lambda hwnd, _: handles.append(hwnd) if self.__gui.IsWindowVisible(hwnd) and not self.__gui.IsIconic(hwnd) and self.__gui.GetWindowText(hwnd) else None, None)
+        return [(hwnd, tuple(self.__gui.GetWindowRect(hwnd))) for hwnd in handles]
+
+    def elements(self, key: int) -> list[dict]:
+        """Lookups run on worker threads (the prefetch and the tool executor), so COM is initialised for the calling thread around every walk."""
+        elements = []
+        try:
+            with self.__automation.UIAutomationInitializerInThread():
+                for control, _ in self.__automation.WalkControl(self.__automation.ControlFromHandle(key), includeTop=True, maxDepth=self.__max_depth):
+                    if control.Name and not control.IsOffscreen:
+                        rect = control.BoundingRectangle
+                        elements.append({"name" : control.Name, "role" : control.ControlTypeName.removesuffix("Control"), "rect" : (rect.left, rect.top, rect.right, rect.bottom)})
+                        if len(elements) >= self.__max_elements:
+                            break
+        except Exception as error:
+            print(f"UI Automation walk of window {key} failed: {error}")
+        return elements
+
+class ATSPIProvider(Provider):
+
+    def __init__(self, max_depth: int = 16, max_elements: int = 2000) -> None:
+        import pyatspi
+        self.__atspi = pyatspi
+        self.__max_depth = max_depth
+        self.__max_elements = max_elements
+        self.__windows = {}
+
+    def __extents(self, accessible) -> tuple[int, int, int, int]:
+        x, y, width, height = accessible.queryComponent().getExtents(self.__atspi.DESKTOP_COORDS)
+        return (x, y, x + width, y + height)
+
+    def windows(self) -> list[tuple[str, tuple[int, int, int, int]]]:
+        windows = []
+        for app_index, app in enumerate(self.__atspi.Registry.getDesktop(0)):
+            for window_index, window in enumerate(app or []):
+                if window is None or not window.getState().contains(self.__atspi.STATE_SHOWING):
+                    continue
+                key = f"{app.name}:{app_index}:{window_index}"
+                self.__windows[key] = window
+                windows.append((window.getState().contains(self.__atspi.STATE_ACTIVE), key, self.__extents(window)))
+        return [(key, rect) for _, key, rect in sorted(windows, key=lambda window: not window[0])]
+
+    def elements(self, key: str) -> list[dict]:
+        elements = []
+        stack = [(self.__windows[key], 0)] if key in self.__windows else []
+        try:
+            while stack and len(elements) < self.__max_elements:
+                accessible, depth = stack.pop()
+                if accessible is None or not accessible.getState().contains(self.__atspi.STATE_SHOWING):
+                    continue
+                if accessible.name:
+                    elements.append({"name" : accessible.name, "role" : accessible.getRoleName(), "rect" : self.__extents(accessible)})
+                if depth < self.__max_depth:
+                    stack.extend((child, depth + 1) for child in accessible)
+        except Exception as error:
+            print(f"AT-SPI walk of window {key} failed: {error}")
+        return elements
+
+class MockProvider(Provider):
+    """In-memory tree for tests and headless runs: `set_window` and `remove_window` stand in for windows opening, changing and closing."""
+
+    def __init__(self) -> None:
+        self.__windows = {}
+        self.walks = 0
+
+    def set_window(self, key, rect: tuple[int, int, int, int], elements: list[dict]) -> None:
+        self.__windows.pop(key, None)
+        self.__windows = {key: (tuple(rect), list(elements)), **self.__windows}
+
+    def remove_window(self, key) -> None:
+        self.__windows.pop(key, None)
+
+    def windows(self) -> list[tuple[object, tuple[int, int, int, int]]]:
+        return [(key, rect) for key, (rect, _) in self.__windows.items()]
+
+    def elements(self, key) -> list[dict]:
+        self.walks += 1
+        return list(self.__windows[key][1]) if key in self.__windows else []
+
+def get_provider() -> Provider:
+    """The platform's accessibility provider, or None where it is not available."""
+    try:
+        if sys.platform == "win32":
+            return UIAutomationProvider()
+        if sys.platform.startswith("linux"):
+            return ATSPIProvider()
+    except Exception as error:
+        print(f"Accessibility tree unavailable: {error}")
+    return None
+
+class AccessibilityTree:
+    """Cached UI element tree used as the grounding tier before vision. Windows are walked again only when they appear, move or overlap a changed screen region; lookups fuzzy-match names and roles against the cached elements."""
+
+    def __init__(self, provider: Provider, size: tuple[int, int], matcher: ElementMatcher = None) -> None:
+        self.__provider = provider
+        self.__width, self.__height = size
+        self.__matcher = matcher or ElementMatcher(threshold=0.85)
+        self.__windows = {}
+        self.__items = None
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __type(self, role: str) -> str:
+        return "icon" if role.lower().replace(" ", "") in ICON_ROLES else "text"
+
+    def __visible(self, rect: tuple[int, int, int, int], above: list[tuple[int, int, int, int]]) -> bool:
+        x, y = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        return 0 <= x < self.__width and 0 <= y < self.__height and not any(left <= x < right and top <= y < bottom for left, top, right, bottom in above)
+
+    def __refresh(self) -> dict:
+        with tracer.span("accessibility.refresh") as span:
+            windows = self.__provider.windows()
+            walked = 0
+            for key, rect in windows:
+                cached = self.__windows.get(key)
+                if cached is None or cached["rect"] != rect or cached["dirty"]:
+                    self.__windows[key] = {"rect" : rect, "elements" : self.__provider.elements(key), "dirty" : False}
+                    walked += 1
+            keys = [key for key, _ in windows]
+            for key in set(self.__windows) - set(keys):
+                del self.__windows[key]
+            span["windows"], span["walked"] = len(keys), walked
+            if walked or self.__items is None or list(self.__items["order"]) != keys:
+                items, above = {}, []
+                for order, key in enumerate(keys):
+                    window = self.__windows[key]
+                    for element in window["elements"]:
+                        if element["role"].lower().replace(" ", "") in CONTAINER_ROLES or not self.__visible(element["rect"], above):
+                            continue
+                        left, top, right, bottom = element["rect"]
+                        items[len(items)] = {"content" : element["name"], "type" : self.__type(element["role"]), "role" : element["role"], "window" : order, "rect" : element["rect"],
+                                             "bbox" : [left / self.__width, top / self.__height, right / self.__width, bottom / self.__height]}
+                    above.append(window["rect"])
+                names = {}
+                for id, item in items.items():
+                    names.setdefault(" ".join(item["content"].lower().split()), []).append(id)
+                self.__items = {"order" : keys, "items" : items, "names" : names}
+        return self.__items["items"]
+
+    def invalidate(self, regions: list[tuple[int, int, int, int]] = None) -> None:
+        """Mark windows overlapping the changed regions (all windows when None) to be walked again on the next lookup."""
+        with self.__lock:
+            for window in self.__windows.values():
+                if regions is None or any(overlaps(window["rect"], region) for region in regions):
+                    window["dirty"] = True
+
+    def locate(self, object: str) -> tuple[int, int]:
+        """Centre of the control matching the description, or None when no control matches unambiguously."""
+        with self.__lock, tracer.span("grounding.accessibility") as span:
+            items = self.__refresh()
+            exact = self.__items["names"].get(" ".join(object.lower().split()))
+            best = exact[0] if exact else self.__matcher.match(object, items)[0]
+            if best is not None:
+                same = [id for id in self.__items["names"][" ".join(items[best]["content"].lower().split())] if items[id]["role"] == items[best]["role"]]
+                front = [id for id in same if items[id]["window"] == min(items[other]["window"] for other in same)]
+                best = front[0] if len(front) == 1 else None
+            span["hit"] = best is not None
+            if best is None:
+                self.misses += 1
+                tracer.count("accessibility_misses")
+                return None
+            self.hits += 1
+            tracer.count("accessibility_hits")
+            left, top, right, bottom = items[best]["rect"]
+            print(f"Object: {object}, matched {items[best]['role']} \"{items[best]['content']}\" in the accessibility tree")
+            return (left + right) // 2, (top + bottom) // 2
+
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
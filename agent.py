@@ -1,21 +1,28 @@
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
-from langchain_core.messages import AnyMessage, ToolMessage
-from typing import Annotated, TypedDict
-import operator, time, base64
-from openai import RateLimitError
-from PIL import ImageGrab
+from langchain_core.messages import AIMessage, AnyMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from typing import Annotated, Callable, TypedDict
+import asyncio, operator, uuid, weakref
+
+from backends import get_backend
+from capture import EncodedImage, Frame, ImageEncoder, ScreenCapture
+from context import ContextWindow
+from llm import LLMClient, client
+from nodes import TASK_COMPLETE, TASK_FAILED
+from tracing import tracer
+from verify import ActionVerifier
 
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
 
 class Agent:
 
-    def __init__(self, tools: list, model: ChatOpenAI = ChatOpenAI(model = "gpt-5", reasoning_effort="minimal")):
+    def __init__(self, tools: list, model: ChatOpenAI = None, capture: ScreenCapture = None, prefetch: Callable[[list[str]], None] = None, resolve: Callable[[list[str]], dict] = None, verifier: ActionVerifier = None, max_images: int = 2, max_context_bytes: int = 5_000_000, encoder: ImageEncoder = None, llm: LLMClient = client):
 
         __graph = StateGraph(AgentState)
-        __graph.add_node("llm", self.__call_llm)
-        __graph.add_node("action", self.__take_action)
+        __graph.add_node("llm", RunnableLambda(self.__call_llm, afunc=self.__acall_llm))
+        __graph.add_node("action", RunnableLambda(self.__take_action, afunc=self.__atake_action))
         __graph.add_conditional_edges(
             "llm",
             self.__check_action,
@@ -25,49 +32,188 @@ class Agent:
         __graph.set_entry_point("llm")
         self.graph = __graph.compile()
         self.__tools = {t.name: t for t in tools}
-        self.__model = model.bind_tools(tools)
+        self.__model = (model or llm.chat_model("gpt-5", reasoning_effort="minimal")).bind_tools(tools)
+        self.__capture = capture or ScreenCapture(get_backend().grab)
+        self.__prefetch = prefetch
+        self.__resolve = resolve
+        self.__verifier = verifier
+        self.__max_images = max_images
+        self.__max_context_bytes = max_context_bytes
+        self.__encoder = encoder or ImageEncoder()
+        self.__llm = llm
+        self.__runs = {}
+
+    def __session(self, config: RunnableConfig) -> tuple[dict, ScreenCapture, Callable[[list[str]], None], Callable[[list[str]], dict], ActionVerifier]:
+        """Tools, capture, prefetch, resolve and verifier for this run: the agent's own, or those of the session passed as `configurable.session` so one compiled graph can drive many displays."""
+        session = (config or {}).get("configurable", {}).get("session")
+        if session is None:
+            return self.__tools, self.__capture, self.__prefetch, self.__resolve, self.__verifier
+        return session.tools, session.capture, session.prefetch, session.resolve, session.verifier
+
+    def __run(self, messages: list[AnyMessage]) -> dict:
+        key = id(messages[0])
+        if key not in self.__runs:
+            self.__runs[key] = {"context" : ContextWindow(self.__max_images, self.__max_context_bytes), "previous" : None, "id" : uuid.uuid4().hex[:12], "step" : 0, "fingerprint" : None, "signature" : None, "trajectory" : [], "frame" : None}
+            weakref.finalize(messages[0], self.__runs.pop, key, None)
+        return self.__runs[key]
+
+    def __context(self, messages: list[AnyMessage]) -> list[AnyMessage]:
+        run = self.__run(messages)
+        run["step"] += 1
+        tracer.bind(run=run["id"], step=run["step"])
+        messages = run["context"].update(messages)
+        tracer.count("llm_request_bytes", run["context"].bytes)
+        return messages
+
+    def __bind_step(self, messages: list[AnyMessage]) -> None:
+        run = self.__run(messages)
+        tracer.bind(run=run["id"], step=run["step"])
+
+    def __encode(self, messages: list[AnyMessage], screenshot: Frame) -> EncodedImage:
+        run = self.__run(messages)
+        image = self.__encoder.encode(screenshot.image, run["previous"])
+        run["previous"] = screenshot.image if self.__encoder.crop_changes else None
+        print(f"Screenshot: {image.bytes / 1024:.1f} KB ({image.size[0]}x{image.size[1]}{', changed region only' if image.region else ''}) encoded in {image.encode_ms:.1f} ms")
+        return image
+
+    def __record(self, messages: list[AnyMessage], tools: dict, tool_calls: list[dict], resolve: Callable[[list[str]], dict], screenshot: Frame) -> None:
+        run = self.__run(messages)
+        calls = [{"name" : t["name"], "args" : t["args"]} for t in tool_calls if t["name"] in tools]
+        objects = self.__target_objects(calls)
+        points = resolve(objects) if resolve is not None and objects else {}
+        run["trajectory"].append({"calls" : calls, "points" : points, "fingerprint" : run["fingerprint"], "signature" : run["signature"], "fallback" : resolve is not None and any(object not in points for object in objects)})
+        run["fingerprint"], run["signature"] = screenshot.fingerprint, screenshot.signature
+        run["frame"] = screenshot
+
+    def __before(self, messages: list[AnyMessage], capture: ScreenCapture, verifier: ActionVerifier) -> tuple[Frame, Frame]:
+        """The frame the model last saw and a fresh one taken right before the actions run."""
+        if verifier is None:
+            return None, None
+        return self.__run(messages)["frame"], capture.grab()
+
+    def __verify(self, verifier: ActionVerifier, tools: dict, tool_calls: list[dict], results: list[ToolMessage], reference: Frame, before: Frame, screenshot: Frame, capture: ScreenCapture) -> Frame:
+        """Check every call of the step against the frames before and after it, repeat pointer actions that visibly did nothing and add the outcome to each tool result."""
+        if verifier is None:
+            return screenshot
+        with tracer.span("verify", calls=len(tool_calls)) as span:
+            checks = verifier.check(before, screenshot, tool_calls, reference)
+            for attempt in range(verifier.retries):
+                missed = [index for index, check in enumerate(checks) if check.retry and tool_calls[index]["name"] in tools]
+                if not missed:
+                    break
+                verifier.forget([tool_calls[index] for index in missed])
+                for index in missed:
+                    print(f"No visible effect, retrying: {tool_calls[index]}")
+                    with tracer.span("tool", tool=tool_calls[index]["name"], retry=attempt + 1):
+                        results[index].content = str(tools[tool_calls[index]["name"]].invoke(tool_calls[index]["args"]))
+                tracer.count("verify_retries", len(missed))
+                screenshot = capture.wait_until_stable()
+                for index, check in zip(missed, verifier.check(before, screenshot, [tool_calls[index] for index in missed], reference)):
+                    check.retries = attempt + 1
+                    checks[index] = check
+            for result, check in zip(results, checks):
+                if check.ok is not None:
+                    result.content = f"{result.content}\n{check}"
+                    tracer.count("verify_ok" if check.ok else "verify_failed")
+            span["failed"] = sum(check.ok is False for check in checks)
+        return screenshot
+
+    def trajectory(self, messages: list[AnyMessage]) -> list[dict]:
+        """The steps of a run so far: tool calls, the coordinates their targets resolved to, whether any target could not be grounded and the fingerprint and signature of the frame each step started from (None for the first)."""
+        return list(self.__run(messages)["trajectory"])
+
+    def succeeded(self, messages: list[AnyMessage]) -> bool:
+        """Whether the run ended with the model reporting the task as complete."""
+        message = messages[-1]
+        if not isinstance(message, AIMessage) or message.tool_calls:
+            return False
+        return TASK_COMPLETE in str(message.content) and TASK_FAILED not in str(message.content)
+
+    def __attach_screenshot(self, results: list[ToolMessage], image: EncodedImage) -> None:
+        if image.region is not None:
+            description = f"Also, only the region {image.region} (left, top, right, bottom in screen pixels) changed after performing all the previous actions, the following is the screenshot of that region:\n"
+        else:
+            description = "Also, the following is the screenshot of the screen after performing all the previous actions:\n"
+        results[-1].content = [
+            {"type" : "text", "text" : f"{results[-1].content}\n\n{description}"},
+            {"type" : "image_url",
+            "image_url" : {"url" : image.data_url}}
+        ]
+
+    def __target_objects(self, tool_calls: list[dict]) -> list[str]:
+        return [value for t in tool_calls for key, value in t["args"].items() if key.endswith("_object")]
+
+    def __first_target(self, tools: dict, tool_calls: list[dict]) -> int:
+        """Index of the first call that needs grounding. Targets are prefetched only from there on, so calls before it (typing, keys) never leave the prefetch with a stale frame."""
+        return next((index for index, t in enumerate(tool_calls) if t["name"] in tools and self.__target_objects([t])), None)
 
     def __call_llm(self, state: AgentState):
-        try:
-            message = self.__model.invoke(state["messages"])
-            for m in range(len(state["messages"])):
-                if isinstance(state["messages"][m], ToolMessage):
-                    state["messages"][m].content = ""
-            return {"messages" : [message]}
-        except RateLimitError:
-            time.sleep(20)
-            message = self.__model.invoke(state["messages"])
-            for m in range(len(state["messages"])):
-                if isinstance(state["messages"][m], ToolMessage):
-                    state["messages"][m].content = ""
-            return {"messages" : [message]}
+        messages = self.__context(state["messages"])
+        message = self.__llm.invoke(self.__model, messages)
+        return {"messages" : [message]}
+
+    async def __acall_llm(self, state: AgentState):
+        messages = self.__context(state["messages"])
+        message = await self.__llm.ainvoke(self.__model, messages)
+        return {"messages" : [message]}
     
-    def __take_action(self, state: AgentState):
+    def __take_action(self, state: AgentState, config: RunnableConfig):
+        try:
+            self.__bind_step(state["messages"])
+            tools, capture, prefetch, resolve, verifier = self.__session(config)
+            tool_calls = state["messages"][-1].tool_calls
+            results = []
+            reference, before = self.__before(state["messages"], capture, verifier)
+            first = self.__first_target(tools, tool_calls)
+            for index, t in enumerate(tool_calls):
+                print(f"Calling: {t}")
+                if not t["name"] in tools:
+                    result = "bad tool name, retry"
+                else:
+                    if index == first and prefetch is not None:
+                        prefetch(self.__target_objects(tool_calls[index:]))
+                    with tracer.span("tool", tool=t["name"]):
+                        result = tools[t["name"]].invoke(t["args"])
+                results.append(ToolMessage(tool_call_id = t["id"], name = t["name"], content = str(result)))
+            screenshot = capture.wait_until_stable()
+            screenshot = self.__verify(verifier, tools, tool_calls, results, reference, before, screenshot, capture)
+            self.__record(state["messages"], tools, tool_calls, resolve, screenshot)
+            image = self.__encode(state["messages"], screenshot)
+            self.__attach_screenshot(results, image)
+            return {"messages" : results}
+        except Exception as error:
+            print(f"Failed while running: {state['messages'][-1].tool_calls}")
+            raise error
+
+    async def __atake_action(self, state: AgentState, config: RunnableConfig):
         try:
+            self.__bind_step(state["messages"])
+            tools, capture, prefetch, resolve, verifier = self.__session(config)
             tool_calls = state["messages"][-1].tool_calls
             results = []
-            for t in tool_calls:
+            first = self.__first_target(tools, tool_calls)
+            if first == 0 and prefetch is not None:
+                (reference, before), _ = await asyncio.gather(asyncio.to_thread(self.__before, state["messages"], capture, verifier), asyncio.to_thread(prefetch, self.__target_objects(tool_calls)))
+            else:
+                reference, before = await asyncio.to_thread(self.__before, state["messages"], capture, verifier)
+            for index, t in enumerate(tool_calls):
                 print(f"Calling: {t}")
-                if not t["name"] in self.__tools:
+                if not t["name"] in tools:
                     result = "bad tool name, retry"
                 else:
-                    result = self.__tools[t["name"]].invoke(t["args"])
+                    if index == first and index > 0 and prefetch is not None:
+                        await asyncio.to_thread(prefetch, self.__target_objects(tool_calls[index:]))
+                    with tracer.span("tool", tool=t["name"]):
+                        result = await tools[t["name"]].ainvoke(t["args"])
                 results.append(ToolMessage(tool_call_id = t["id"], name = t["name"], content = str(result)))
-            screenshot = ImageGrab.grab()
-            time.sleep(1)
-            screenshot.save("screenshot.jpeg")
-            screenshot.close()
-            with open("screenshot.jpeg", "rb") as image_file:
-                image = base64.b64encode(image_file.read()).decode('utf-8')
-                image_file.close()
-            results[-1].content = [
-                {"type" : "text", "text" : f"{results[-1].content}\n\nAlso, the following is the screenshot of the screen after performing all the previous actions:\n"},
-                {"type" : "image_url",
-                "image_url" : {"url" : f"data:image/jpeg;base64,{image}"}}
-            ]
+            screenshot = await asyncio.to_thread(capture.wait_until_stable)
+            screenshot = await asyncio.to_thread(self.__verify, verifier, tools, tool_calls, results, reference, before, screenshot, capture)
+            self.__record(state["messages"], tools, tool_calls, resolve, screenshot)
+            image = await asyncio.to_thread(self.__encode, state["messages"], screenshot)
+            self.__attach_screenshot(results, image)
             return {"messages" : results}
         except Exception as error:
-            print(t)
+            print(f"Failed while running: {state['messages'][-1].tool_calls}")
             raise error
     
     def __check_action(self, state: AgentState):
@@ -0,0 +1,161 @@
+import ctypes, sys, time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Callable, Literal
+from PIL import Image, ImageDraw
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_int32), ("dy", ctypes.c_int32), ("mouseData", ctypes.c_uint32), ("dwFlags", ctypes.c_uint32), ("time", ctypes.c_uint32), ("dwExtraInfo", ctypes.c_size_t)]
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [("wVk", ctypes.c_uint16), ("wScan", ctypes.c_uint16), ("dwFlags", ctypes.c_uint32), ("time", ctypes.c_uint32), ("dwExtraInfo", ctypes.c_size_t)]
+
+class HARDWAREINPUT(ctypes.Structure):
+    _fields_ = [("uMsg", ctypes.c_uint32), ("wParamL", ctypes.c_uint16), ("wParamH", ctypes.c_uint16)]
+
+class INPUTUNION(ctypes.Union):
+    _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT), ("hi", HARDWAREINPUT)]
+
+class INPUT(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("union", INPUTUNION)]
+
+class Backend(ABC):
+
+    @abstractmethod
+    def get_size(self) -> tuple[int, int]: ...
+
+    @abstractmethod
+    def get_cursor_position(self) -> tuple[int, int]: ...
+
+    @abstractmethod
+    def set_cursor_position(self, position: tuple[int, int]) -> None: ...
+
+    @abstractmethod
+    def mouse_button(self, button: Literal["left", "right", "middle"], up: bool) -> None: ...
+
+    @abstractmethod
+    def scroll(self, direction: Literal["vertical", "horizontal"], delta: int) -> None: ...
+
+    @abstractmethod
+    def key(self, code: int, up: bool) -> None: ...
+
+    @abstractmethod
+    def send_keys(self, events: list[tuple[int, bool, bool]]) -> None:
+        """Submit a batch of (code, up, unicode) key events at once. Unicode events carry a UTF-16 code unit instead of a virtual-key code."""
+
+    @abstractmethod
+    def get_window_rect(self, hwnd: int) -> tuple[int, int, int, int]: ...
+
+    @abstractmethod
+    def grab(self) -> Image.Image: ...
+
+class Win32Backend(Backend):
+
+    def __init__(self) -> None:
+        import win32api, win32con, win32gui
+        from PIL import ImageGrab
+        self.__api, self.__con, self.__gui, self.__grab = win32api, win32con, win32gui, ImageGrab.grab
+        self.__buttons = {
+            "left": (win32con.MOUSEEVENTF_LEFTDOWN, win32con.MOUSEEVENTF_LEFTUP),
+            "right": (win32con.MOUSEEVENTF_RIGHTDOWN, win32con.MOUSEEVENTF_RIGHTUP),
+            "middle": (win32con.MOUSEEVENTF_MIDDLEDOWN, win32con.MOUSEEVENTF_MIDDLEUP),
+        }
+
+    def get_size(self) -> tuple[int, int]:
+        return self.__api.GetSystemMetrics(0), self.__api.GetSystemMetrics(1)
+
+    def get_cursor_position(self) -> tuple[int, int]:
+        return self.__api.GetCursorPos()
+
+    def set_cursor_position(self, position: tuple[int, int]) -> None:
+        self.__api.SetCursorPos(position)
+
+    def mouse_button(self, button: Literal["left", "right", "middle"], up: bool) -> None:
+        self.__api.mouse_event(self.__buttons[button][up], 0, 0)
+
+    def scroll(self, direction: Literal["vertical", "horizontal"], delta: int) -> None:
+        if direction == "vertical":
+            self.__api.mouse_event(self.__con.MOUSEEVENTF_WHEEL, 0, 0, delta, 0)
+        elif direction == "horizontal":
+            self.__api.mouse_event(self.__con.MOUSEEVENTF_HWHEEL, 0, 0, delta, 0)
+
+    def key(self, code: int, up: bool) -> None:
+        self.__api.keybd_event(code, 0, self.__con.KEYEVENTF_KEYUP if up else 0, 0)
+
+    def send_keys(self, events: list[tuple[int, bool, bool]]) -> None:
+        inputs = (INPUT * len(events))()
+        for index, (code, up, unicode) in enumerate(events):
+            flags = (self.__con.KEYEVENTF_KEYUP if up else 0) | (0x0004 if unicode else 0)
+            inputs[index].type = 1
+            inputs[index].union.ki = KEYBDINPUT(wVk=0 if unicode else code, wScan=code if unicode else 0, dwFlags=flags)
+        if ctypes.windll.user32.SendInput(len(events), inputs, ctypes.sizeof(INPUT)) != len(events):
+            raise ctypes.WinError()
+
+    def get_window_rect(self, hwnd: int) -> tuple[int, int, int, int]:
+        rect = self.__gui.GetWindowRect(hwnd)
+        return rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1]
+
+    def grab(self) -> Image.Image:
+        return self.__grab()
+
+class HeadlessBackend(Backend):
+    """Virtual display that records every input event and serves synthetic frames, for running the agent loop without a GUI."""
+
+    def __init__(self, size: tuple[int, int] = (1920, 1080), frames: Callable[["HeadlessBackend"], Image.Image] = None) -> None:
+        self.__size = size
+        self.__cursor = (size[0] // 2, size[1] // 2)
+        self.__frames = frames
+        self.__lock = Lock()
+        self.events = []
+
+    def __record(self, *event) -> None:
+        with self.__lock:
+            self.events.append((time.perf_counter(), *event))
+
+    def get_size(self) -> tuple[int, int]:
+        return self.__size
+
+    def get_cursor_position(self) -> tuple[int, int]:
+        return self.__cursor
+
+    def set_cursor_position(self, position: tuple[int, int]) -> None:
+        self.__cursor = tuple(position)
+        self.__record("move", self.__cursor)
+
+    def mouse_button(self, button: Literal["left", "right", "middle"], up: bool) -> None:
+        self.__record("mouse", button, up)
+
+    def scroll(self, direction: Literal["vertical", "horizontal"], delta: int) -> None:
+        self.__record("scroll", direction, delta)
+
+    def key(self, code: int, up: bool) -> None:
+        self.__record("key", code, up)
+
+    def send_keys(self, events: list[tuple[int, bool, bool]]) -> None:
+        for code, up, unicode in events:
+            self.__record("unicode" if unicode else "key", code, up)
+
+    def get_window_rect(self, hwnd: int) -> tuple[int, int, int, int]:
+        return 0, 0, self.__size[0], self.__size[1]
+
+    def grab(self) -> Image.Image:
+        if self.__frames is not None:
+            return self.__frames(self)
+        image = Image.new("RGB", self.__size, (32, 32, 32))
+        draw = ImageDraw.Draw(image)
+        with self.__lock:
+            count = len(self.events)
+        width, height = self.__size
+        offset = (count * 97) % max(1, width - width // 4)
+        draw.rectangle((offset, height // 4, offset + width // 4, height // 2), fill=(200, 200, 200))
+        x, y = self.__cursor
+        draw.ellipse((x - 6, y - 6, x + 6, y + 6), fill=(255, 0, 0))
+        return image
+
+_default_backend = None
+
+def get_backend() -> Backend:
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = Win32Backend() if sys.platform == "win32" else HeadlessBackend()
+    return _default_backend
@@ -0,0 +1,201 @@
+import argparse, asyncio, base64, glob, io, json, math, statistics, time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from agent import Agent
+from backends import HeadlessBackend
+from capture import ImageEncoder, ScreenCapture
+from llm import client
+from models import registry
+from nodes import Nodes
+from tracing import tracer
+from windows import Keyboard, Mouse, ObjectName, Screen
+
+class ScriptedModel(BaseChatModel):
+    """Stand-in for the agent LLM that replays a fixed cycle of tool calls for a given number of steps."""
+
+    steps: int = 20
+    calls: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls.append(time.perf_counter())
+        step = sum(isinstance(message, AIMessage) for message in messages) + 1
+        script = [
+            ("click", {"button": "left", "to_object": f"button {step % 5}"}),
+            ("type_string", {"text": "Hello, World!"}),
+            ("press_key", {"key": "enter"}),
+            ("scroll", {"direction": "vertical", "delta": -120}),
+        ]
+        if step > self.steps:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="TASK COMPLETE"))])
+        name, args = script[step % len(script)]
+        message = AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{step}"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+class CentreGrounding:
+    """Stand-in grounding backend that points at the centre of the screen."""
+
+    def parse_image_batch(self, image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        return [[(0.5, 0.5)] for _ in objects]
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1] if len(values) > 1 else values[0]
+
+def run_loop(steps: int, size: tuple[int, int], use_async: bool = False) -> None:
+    registry.register("gui_actor", CentreGrounding())
+    backend = HeadlessBackend(size=size)
+    capture = ScreenCapture(backend.grab)
+    mouse = Mouse(choice="gui_actor", capture=capture, backend=backend)
+    tools = mouse.return_tools() + Keyboard(backend).return_tools()
+    model = ScriptedModel(steps=steps, calls=[])
+    agent = Agent(tools, model=model, capture=capture, prefetch=mouse.prefetch)
+
+    start = time.perf_counter()
+    screenshot = capture.grab()
+    messages = Nodes().agent_message(Screen(backend).get_size(), "benchmark", screenshot.base64)
+    if use_async:
+        asyncio.run(agent.graph.ainvoke({"messages": messages}, {"recursion_limit": 2 * steps + 10}))
+    else:
+        agent.graph.invoke({"messages": messages}, {"recursion_limit": 2 * steps + 10})
+    total = time.perf_counter() - start
+
+    latencies = [(b - a) * 1000 for a, b in zip(model.calls, model.calls[1:])]
+    print(f"Mode: {'async' if use_async else 'sync'}, steps: {len(latencies)}, input events: {len(backend.events)}, screen: {size[0]}x{size[1]}")
+    print(f"Step latency ms: p50 {percentile(latencies, 50):.2f}, p95 {percentile(latencies, 95):.2f}, max {max(latencies):.2f}")
+    print(f"Throughput: {len(latencies) / total:.2f} steps/s")
+    print(tracer.report())
+
+def run_typing(length: int, repeats: int) -> None:
+    text = ("The Quick Brown Fox, 42 times! SHOUTING & naïve café \n" * (length // 55 + 1))[:length]
+    keyboard = Keyboard(HeadlessBackend())
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        events = keyboard.compile_string(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    print(f"Characters: {len(text)}, events: {len(events)} ({len(events) / len(text):.2f} per character)")
+    print(f"Event building ms: p50 {percentile(timings, 50):.3f}, p95 {percentile(timings, 95):.3f} ({percentile(timings, 50) * 1000 / len(text):.2f} us per character)")
+
+def synthetic_screens(size: tuple[int, int], count: int) -> list[Image.Image]:
+    screens = []
+    for index in range(count):
+        image = Image.new("RGB", size, (240, 240, 240))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, size[0], 40), fill=(30, 60, 120))
+        for row in range(0, size[1] - 80, 28):
+            draw.text((40, 60 + row), f"Item {row // 28} of window {index}: the quick brown fox jumps over the lazy dog", fill=(20, 20, 20))
+        draw.rectangle((size[0] // 2 + index * 40, size[1] // 3, size[0] // 2 + index * 40 + 200, size[1] // 3 + 60), fill=(0, 120, 215))
+        screens.append(image)
+    return screens
+
+def psnr(original: Image.Image, encoded: str) -> float:
+    decoded = Image.open(io.BytesIO(base64.b64decode(encoded))).convert("RGB").resize(original.size, Image.Resampling.BILINEAR)
+    mse = statistics.fmean(value ** 2 for value in ImageStat.Stat(ImageChops.difference(original.convert("RGB"), decoded)).rms)
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def selection_accuracy(encoder: ImageEncoder, parses: list[tuple[dict, Image.Image, list[dict]]], model) -> float:
+    """Share of targets for which the LLM, shown OmniParser's labeled image as this encoder sends it, picks an element whose centre lies inside the target box."""
+    hits, total = 0, 0
+    for items, labeled, entries in parses:
+        image = encoder.encode(labeled)
+        for target in entries:
+            result = client.invoke(model, Nodes().mouse_functions(target["object"], items, image.base64, image.mime))
+            chosen = next((item["bbox"] for item in items.values() if (item["content"] or "").lower().strip() == result.name.lower().strip()), None)
+            left, top, right, bottom = target["bbox"]
+            hits += chosen is not None and left <= (chosen[0] + chosen[2]) / 2 <= right and top <= (chosen[1] + chosen[3]) / 2 <= bottom
+            total += 1
+    return hits / max(1, total)
+
+def run_encoding(directory: str, size: tuple[int, int], select: bool = False) -> None:
+    """Bytes, encode time and PSNR per encoder setting. With `select`, also the OmniParser selection accuracy on `directory/targets.json` (same format as for `run_grounding`), which loads OmniParser and calls the LLM."""
+    paths = sorted(glob.glob(f"{directory}/*.png") + glob.glob(f"{directory}/*.jp*g")) if directory else []
+    screens = [Image.open(path).convert("RGB") for path in paths] or synthetic_screens(size, 5)
+    parses, model = [], None
+    if select:
+        with open(f"{directory}/targets.json", encoding="utf-8") as file:
+            targets = json.load(file)
+        model = client.chat_model("gpt-5-mini", reasoning_effort="minimal").with_structured_output(ObjectName, include_raw=True)
+        for name, entries in sorted(targets.items()):
+            items, labeled = registry.get("omni").stream(Image.open(f"{directory}/{name}").convert("RGB")).result()
+            parses.append((items, labeled, entries))
+    settings = [
+        ("full JPEG q75 (baseline)", ImageEncoder(max_long_side=None, max_short_side=None)),
+        ("768p JPEG q75 (default)", ImageEncoder()),
+        ("1080p JPEG q75", ImageEncoder(max_short_side=1080)),
+        ("720p JPEG q60", ImageEncoder(max_short_side=720, quality=60)),
+        ("768p WEBP q60", ImageEncoder(format="WEBP", quality=60)),
+        ("768p JPEG q75 + delta crop", ImageEncoder(crop_changes=True)),
+    ]
+    print(f"Screens: {len(screens)} ({screens[0].size[0]}x{screens[0].size[1]})")
+    for name, encoder in settings:
+        sizes, timings, fidelity = [], [], []
+        previous = None
+        for screen in screens:
+            image = encoder.encode(screen, previous)
+            sizes.append(image.bytes / 1024)
+            timings.append(image.encode_ms)
+            fidelity.append(psnr(screen.crop(image.region) if image.region else screen, image.base64))
+            previous = screen
+        accuracy = f" {selection_accuracy(encoder, parses, model):6.1%} selection accuracy" if parses else ""
+        print(f"{name:32} {statistics.fmean(sizes):8.1f} KB/step {statistics.fmean(timings):7.1f} ms encode {statistics.fmean(fidelity):6.2f} dB PSNR{accuracy}")
+
+def run_grounding(directory: str, backends: list[str]) -> None:
+    """Latency and point accuracy of grounding backends on recorded screenshots. `directory/targets.json` maps each image file to [{"object": ..., "bbox": [left, top, right, bottom]}] in screen ratios."""
+    with open(f"{directory}/targets.json", encoding="utf-8") as file:
+        targets = json.load(file)
+    cases = [(Image.open(f"{directory}/{name}").convert("RGB"), target) for name, entries in sorted(targets.items()) for target in entries]
+    print(f"Screenshots: {len(targets)}, targets: {len(cases)}")
+    reference = None
+    for name in backends:
+        model = registry.get(name)
+        timings, hits, points = [], 0, []
+        for image, target in cases:
+            start = time.perf_counter()
+            x, y = model.parse_image_batch(image, [target["object"]])[0][0]
+            timings.append((time.perf_counter() - start) * 1000)
+            left, top, right, bottom = target["bbox"]
+            hits += left <= x <= right and top <= y <= bottom
+            points.append((x, y))
+        agreement = f"{statistics.fmean(math.dist(a, b) for a, b in zip(points, reference)):.4f}" if reference else "-"
+        reference = reference or points
+        print(f"{name:16} load {registry.load_times.get(name, 0):7.1f} s  p50 {percentile(timings, 50):8.1f} ms  p95 {percentile(timings, 95):8.1f} ms  accuracy {hits / len(cases):6.1%}  mean offset vs {backends[0]} {agreement}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks that run on a headless virtual display with no GUI and no network.")
+    commands = parser.add_subparsers(dest="command")
+    loop = commands.add_parser("loop", help="End-to-end agent loop step latency and throughput")
+    loop.add_argument("--steps", type=int, default=20)
+    loop.add_argument("--width", type=int, default=1920)
+    loop.add_argument("--height", type=int, default=1080)
+    loop.add_argument("--async", dest="use_async", action="store_true", help="Run the graph with ainvoke")
+    typing = commands.add_parser("typing", help="Keyboard.type_string event building")
+    typing.add_argument("--length", type=int, default=1000)
+    typing.add_argument("--repeats", type=int, default=200)
+    encoding = commands.add_parser("encoding", help="Screenshot bytes per step, encode time and fidelity per encoder setting")
+    encoding.add_argument("--images", help="Directory of recorded screenshots (synthetic screens if omitted)")
+    encoding.add_argument("--width", type=int, default=3840)
+    encoding.add_argument("--height", type=int, default=2160)
+    encoding.add_argument("--select", action="store_true", help="Also measure OmniParser selection accuracy against --images/targets.json (loads OmniParser and calls the LLM)")
+    grounding = commands.add_parser("grounding", help="Grounding latency and point accuracy per backend on recorded screenshots (loads the real models)")
+    grounding.add_argument("--images", required=True, help="Directory of recorded screenshots with a targets.json")
+    grounding.add_argument("--backends", nargs="+", default=["gui_actor", "gui_actor_cpu"])
+    arguments = parser.parse_args()
+    if arguments.command == "grounding":
+        run_grounding(arguments.images, arguments.backends)
+    elif arguments.command == "encoding":
+        if arguments.select and not arguments.images:
+            parser.error("--select needs --images with a targets.json")
+        run_encoding(arguments.images, (arguments.width, arguments.height), arguments.select)
+    elif arguments.command == "typing":
+        run_typing(arguments.length, arguments.repeats)
+    else:
+        run_loop(getattr(arguments, "steps", 20), (getattr(arguments, "width", 1920), getattr(arguments, "height", 1080)), getattr(arguments, "use_async", False))
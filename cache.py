@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+class GroundingCache:
+    """LRU of resolved coordinates anchored on one frame fingerprint. A different fingerprint clears it; callers that have diffed the pixels carry entries over to the new frame with `retain`."""
+
+    def __init__(self, max_size: int = 128, max_distance: int = 0) -> None:
+        self.__entries = OrderedDict()
+        self.__max_size = max_size
+        self.__max_distance = max_distance
+        self.__fingerprint = None
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __normalize(self, object: str) -> str:
+        return " ".join(object.lower().split())
+
+    def __sync(self, fingerprint: int) -> None:
+        if self.__fingerprint is None or hamming(self.__fingerprint, fingerprint) > self.__max_distance:
+            self.__entries.clear()
+            self.__fingerprint = fingerprint
+
+    def get(self, fingerprint: int, object: str):
+        with self.__lock:
+            self.__sync(fingerprint)
+            key = (self.__fingerprint, self.__normalize(object))
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint: int, object: str, value) -> None:
+        with self.__lock:
+            self.__sync(fingerprint)
+            key = (self.__fingerprint, self.__normalize(object))
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def retain(self, fingerprint: int, keep: Callable[[object], bool]) -> None:
+        """Re-anchor the cache on a new frame, keeping the entries `keep` accepts instead of clearing everything."""
+        with self.__lock:
+            self.__entries = OrderedDict(((fingerprint, key[1]), value) for key, value in self.__entries.items() if keep(value))
+            self.__fingerprint = fingerprint
+
+    def discard(self, object: str) -> None:
+        with self.__lock:
+            self.__entries = OrderedDict((key, value) for key, value in self.__entries.items() if key[1] != self.__normalize(object))
+
+    def invalidate(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__fingerprint = None
+
+class FrameMemo:
+    """Value computed for one frame, such as an OmniParser parse. Callers invalidate it as soon as the pixels change."""
+
+    def __init__(self, max_distance: int = 0) -> None:
+        self.__max_distance = max_distance
+        self.__fingerprint = None
+        self.__value = None
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: int):
+        with self.__lock:
+            if self.__fingerprint is not None and hamming(self.__fingerprint, fingerprint) <= self.__max_distance:
+                self.hits += 1
+                return self.__value
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint: int, value) -> None:
+        with self.__lock:
+            self.__fingerprint = fingerprint
+            self.__value = value
+
+    def invalidate(self) -> None:
+        with self.__lock:
+            self.__fingerprint = None
+            self.__value = None
@@ -0,0 +1,178 @@
+import base64, io, time
+from threading import Lock
+from typing import Callable, Literal
+from PIL import Image, ImageChops, ImageGrab, ImageStat
+
+from tracing import tracer
+
+class Frame:
+
+    def __init__(self, image: Image.Image) -> None:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self.image = image
+        self.size = image.size
+        self.__jpeg = None
+        self.__base64 = None
+        self.__fingerprint = None
+        self.__signature = None
+        self.__lock = Lock()
+
+    @property
+    def jpeg(self) -> bytes:
+        with self.__lock:
+            if self.__jpeg is None:
+                buffer = io.BytesIO()
+                self.image.save(buffer, format="JPEG")
+                self.__jpeg = buffer.getvalue()
+            return self.__jpeg
+
+    @property
+    def base64(self) -> str:
+        if self.__base64 is None:
+            self.__base64 = base64.b64encode(self.jpeg).decode("utf-8")
+        return self.__base64
+
+    @property
+    def fingerprint(self) -> int:
+        """64-bit difference hash of a 9x8 thumbnail. Good for telling frames apart quickly, too coarse to prove two frames are the same: a menu or typed text can leave it within a bit or two."""
+        if self.__fingerprint is None:
+            pixels = list(self.image.convert("L").resize((9, 8), Image.Resampling.BOX).getdata())
+            fingerprint = 0
+            for row in range(8):
+                for column in range(8):
+                    fingerprint = (fingerprint << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+            self.__fingerprint = fingerprint
+        return self.__fingerprint
+
+    @property
+    def signature(self) -> str:
+        """Mean luminance of each tile of a 64x36 grid, base64 encoded. Compact enough to store and fine enough for `changed_tiles` to see a menu or a dialog that the fingerprint misses."""
+        if self.__signature is None:
+            self.__signature = base64.b64encode(self.image.convert("L").resize((64, 36), Image.Resampling.BOX).tobytes()).decode("ascii")
+        return self.__signature
+
+    def close(self) -> None:
+        self.image.close()
+
+def changed_tiles(first: str, second: str, tolerance: int = 12) -> int:
+    """Number of tiles whose mean luminance differs by more than `tolerance` between two frame signatures."""
+    first, second = base64.b64decode(first), base64.b64decode(second)
+    if len(first) != len(second):
+        return max(len(first), len(second))
+    return sum(abs(a - b) > tolerance for a, b in zip(first, second))
+
+class ScreenCapture:
+
+    def __init__(self, source: Callable[[], Image.Image] = ImageGrab.grab, settle_threshold: float = 0.002, settle_timeout: float = 3.0, settle_interval: float = 0.03, settle_quiet: float = 0.25, settle_after_change: float = 0.06) -> None:
+        self.__source = source
+        self.settle_threshold = settle_threshold
+        self.settle_timeout = settle_timeout
+        self.settle_interval = settle_interval
+        self.settle_quiet = settle_quiet
+        self.settle_after_change = settle_after_change
+        self.__last = None
+
+    def grab(self) -> Frame:
+        with tracer.span("capture"):
+            image = self.__source()
+            self.__last = self.__thumbnail(image)
+            return Frame(image)
+
+    def __thumbnail(self, image: Image.Image, width: int = 128) -> Image.Image:
+        height = max(1, image.size[1] * width // image.size[0])
+        return image.convert("L").resize((width, height), Image.Resampling.BOX)
+
+    def __difference(self, previous: Image.Image, current: Image.Image, tolerance: int = 16) -> float:
+        changed = ImageChops.difference(previous, current).point(lambda value: 255 if value > tolerance else 0)
+        return ImageStat.Stat(changed).mean[0] / 255
+
+    def wait_until_stable(self, threshold: float = None, timeout: float = None, quiet: float = None, after_change: float = None) -> Frame:
+        """Grab frames until the downscaled frame has stayed within the threshold (fraction of changed pixels) long enough, or the timeout expires, and return the last full frame. Once the screen has changed from the last frame this capture handed out, `after_change` seconds of stability are enough. While nothing has changed yet, it waits `quiet` seconds to catch changes that only start a moment after the action, such as a page load or an app launch."""
+        threshold = self.settle_threshold if threshold is None else threshold
+        timeout = self.settle_timeout if timeout is None else timeout
+        quiet = self.settle_quiet if quiet is None else quiet
+        after_change = self.settle_after_change if after_change is None else after_change
+        with tracer.span("settle_wait") as span:
+            deadline = time.perf_counter() + timeout
+            image = self.__source()
+            reference = self.__thumbnail(image)
+            changed = self.__last is not None and self.__last.size == reference.size and self.__difference(self.__last, reference) > threshold
+            stable_since = time.perf_counter()
+            span["frames"] = 1
+            while time.perf_counter() < deadline:
+                time.sleep(self.settle_interval)
+                image = self.__source()
+                current = self.__thumbnail(image)
+                span["frames"] += 1
+                if self.__difference(reference, current) > threshold:
+                    reference, stable_since, changed = current, time.perf_counter(), True
+                elif time.perf_counter() - stable_since >= (after_change if changed else quiet):
+                    break
+            span["changed"] = changed
+            self.__last = current if span["frames"] > 1 else reference
+            return Frame(image)
+
+class EncodedImage:
+
+    def __init__(self, data: bytes, mime: str, size: tuple[int, int], encode_ms: float, region: tuple[int, int, int, int] = None) -> None:
+        self.base64 = base64.b64encode(data).decode("utf-8")
+        self.mime = mime
+        self.size = size
+        self.bytes = len(data)
+        self.encode_ms = encode_ms
+        self.region = region
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{self.base64}"
+
+class ImageEncoder:
+
+    def __init__(self, max_long_side: int = 2048, max_short_side: int = 768, format: Literal["JPEG", "WEBP"] = "JPEG", quality: int = 75, crop_changes: bool = False, crop_threshold: float = 0.25, tolerance: int = 16) -> None:
+        self.max_long_side = max_long_side
+        self.max_short_side = max_short_side
+        self.format = format
+        self.quality = quality
+        self.crop_changes = crop_changes
+        self.crop_threshold = crop_threshold
+        self.tolerance = tolerance
+
+    def __changed_region(self, previous: Image.Image, current: Image.Image, scale: int = 8) -> tuple[int, int, int, int]:
+        size = (max(1, current.size[0] // scale), max(1, current.size[1] // scale))
+        first = previous.convert("L").resize(size, Image.Resampling.BOX)
+        second = current.convert("L").resize(size, Image.Resampling.BOX)
+        bbox = ImageChops.difference(first, second).point(lambda value: 255 if value > self.tolerance else 0).getbbox()
+        if bbox is None:
+            return None
+        margin = 2
+        return (
+            max(0, (bbox[0] - margin) * scale),
+            max(0, (bbox[1] - margin) * scale),
+            min(current.size[0], (bbox[2] + margin) * scale),
+            min(current.size[1], (bbox[3] + margin) * scale),
+        )
+
+    def encode(self, image: Image.Image, previous: Image.Image = None) -> EncodedImage:
+        start = time.perf_counter()
+        region = None
+        if self.crop_changes and previous is not None and previous.size == image.size:
+            changed = self.__changed_region(previous, image)
+            if changed is not None and (changed[2] - changed[0]) * (changed[3] - changed[1]) <= self.crop_threshold * image.size[0] * image.size[1]:
+                region = changed
+        output = image.crop(region) if region is not None else image
+        if output.mode != "RGB":
+            output = output.convert("RGB")
+        scale = min(self.max_long_side / max(output.size) if self.max_long_side else 1.0, self.max_short_side / min(output.size) if self.max_short_side else 1.0)
+        if scale < 1:
+            target = (max(1, round(output.size[0] * scale)), max(1, round(output.size[1] * scale)))
+            if int(1 / scale) >= 2:
+                output = output.reduce(int(1 / scale))
+            if output.size != target:
+                output = output.resize(target, Image.Resampling.BOX)
+        buffer = io.BytesIO()
+        output.save(buffer, format=self.format, quality=self.quality)
+        encoded = EncodedImage(buffer.getvalue(), f"image/{self.format.lower()}", output.size, (time.perf_counter() - start) * 1000, region)
+        tracer.record("encode", encoded.encode_ms / 1000, bytes=encoded.bytes, width=output.size[0], height=output.size[1], cropped=region is not None)
+        tracer.count("screenshot_bytes", encoded.bytes)
+        return encoded
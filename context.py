@@ -0,0 +1,73 @@
+from collections import deque
+from langchain_core.messages import AIMessage, AnyMessage
+
+class ContextWindow:
+    """Request-side view of a conversation that keeps only the latest screenshots as images and stays under a byte budget, folding in new messages incrementally."""
+
+    def __init__(self, max_images: int = 2, max_bytes: int = 5_000_000) -> None:
+        self.__max_images = max_images
+        self.__max_bytes = max_bytes
+        self.__entries = []
+        self.__images = deque()
+        self.__seen = 0
+        self.bytes = 0
+
+    def __size(self, message: AnyMessage) -> int:
+        if isinstance(message.content, str):
+            return len(message.content)
+        size = 0
+        for part in message.content:
+            if isinstance(part, str):
+                size += len(part)
+            elif part.get("type") == "text":
+                size += len(part["text"])
+            elif part.get("type") == "image_url":
+                size += len(part["image_url"]["url"])
+        return size
+
+    def __has_image(self, message: AnyMessage) -> bool:
+        return not isinstance(message.content, str) and any(isinstance(part, dict) and part.get("type") == "image_url" for part in message.content)
+
+    def __summarize(self, message: AnyMessage) -> AnyMessage:
+        text = "".join(part if isinstance(part, str) else part.get("text", "") for part in message.content).strip()
+        return message.model_copy(update={"content": f"{text}\n[Screenshot omitted, superseded by a later screenshot]"})
+
+    def __replace(self, entry: list, message: AnyMessage) -> None:
+        size = self.__size(message)
+        self.bytes += size - entry[1]
+        entry[0], entry[1] = message, size
+
+    def __append(self, message: AnyMessage) -> None:
+        entry = [message, self.__size(message)]
+        self.__entries.append(entry)
+        self.bytes += entry[1]
+        if self.__has_image(message):
+            self.__images.append(entry)
+
+    def __drop_oldest_turn(self) -> bool:
+        turns = [index for index, entry in enumerate(self.__entries) if isinstance(entry[0], AIMessage)]
+        if len(turns) < 2:
+            return False
+        for entry in self.__entries[turns[0]:turns[1]]:
+            self.bytes -= entry[1]
+        dropped = {id(entry) for entry in self.__entries[turns[0]:turns[1]]}
+        self.__images = deque(entry for entry in self.__images if id(entry) not in dropped)
+        del self.__entries[turns[0]:turns[1]]
+        return True
+
+    def __enforce(self) -> None:
+        while len(self.__images) > self.__max_images:
+            entry = self.__images.popleft()
+            self.__replace(entry, self.__summarize(entry[0]))
+        while self.bytes > self.__max_bytes and len(self.__images) > 1:
+            entry = self.__images.popleft()
+            self.__replace(entry, self.__summarize(entry[0]))
+        while self.bytes > self.__max_bytes and self.__drop_oldest_turn():
+            pass
+
+    def update(self, messages: list[AnyMessage]) -> list[AnyMessage]:
+        for message in messages[self.__seen:]:
+            self.__append(message)
+        self.__seen = len(messages)
+        self.__enforce()
+        return [entry[0] for entry in self.__entries]
@@ -1,25 +1,52 @@
+import os
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+from typing import Literal
 import torch
-from transformers import AutoProcessor
+from PIL import Image
+from transformers import AutoProcessor, QuantoConfig
 
+from gui_actor.constants import chat_template
 from gui_actor.modeling_qwen25vl import Qwen2_5_VLForConditionalGenerationWithPointer
-from gui_actor.inference import inference
+from gui_actor.inference import inference, get_prediction_region_point
+from qwen_vl_utils import process_vision_info
+
+from tracing import tracer
 
 class GUIActor:
-    def __init__(self, model = "microsoft/GUI-Actor-7B-Qwen2.5-VL"):
-        self.__data_processor = data_processor = AutoProcessor.from_pretrained(model, max_pixels=768*768, use_fast=True)
+    def __init__(self, model = "microsoft/GUI-Actor-7B-Qwen2.5-VL", device: Literal["cuda", "cpu"] = "cuda", quantization: Literal["int8", "int4"] = None, threads: int = None, max_pixels: int = 768*768):
+        self.__data_processor = data_processor = AutoProcessor.from_pretrained(model, max_pixels=max_pixels, use_fast=True)
         self.__tokenizer = data_processor.tokenizer
-        __max_memory = {0: "7800MiB", "cpu": "26GiB"}
-
-        self.__model = Qwen2_5_VLForConditionalGenerationWithPointer.from_pretrained(
-            model,
-            device_map={"": 0},
-            max_memory=__max_memory,
-            attn_implementation="flash_attention_2",
-            torch_dtype=torch.bfloat16
-        ).eval()
-
-    def parse_image(self, image_path: str, object: str) -> tuple[float, float]:
-        conversation = [
+
+        self.__threads = None
+        self.__lock = Lock()
+        if device == "cpu":
+            self.__threads = threads or os.cpu_count()
+            options = {"device_map": {"": "cpu"}, "attn_implementation": "sdpa", "torch_dtype": torch.float32}
+        else:
+            __max_memory = {0: "7800MiB", "cpu": "26GiB"}
+            options = {"device_map": {"": 0}, "max_memory": __max_memory, "attn_implementation": "flash_attention_2", "torch_dtype": torch.bfloat16}
+        if quantization is not None:
+            options["quantization_config"] = QuantoConfig(weights=quantization, modules_to_not_convert=["lm_head", "multi_patch_pointer_head"])
+
+        self.__model = Qwen2_5_VLForConditionalGenerationWithPointer.from_pretrained(model, **options).eval()
+
+    @contextmanager
+    def __cpu_threads(self):
+        """Run CPU inference with the configured intra-op thread count, restoring the process-wide setting afterwards."""
+        with self.__lock:
+            previous = torch.get_num_threads()
+            torch.set_num_threads(self.__threads)
+            try:
+                yield
+            finally:
+                torch.set_num_threads(previous)
+
+    def __inference(self):
+        return self.__cpu_threads() if self.__threads is not None else nullcontext()
+
+    def __conversation(self, image: Image.Image, object: str) -> list[dict]:
+        return [
             {
                 "role": "system",
                 "content": [
@@ -34,7 +61,7 @@ class GUIActor:
                 "content": [
                     {
                         "type": "image",
-                        "image": image_path
+                        "image": image
                     },
                     {
                         "type": "text",
@@ -44,15 +71,77 @@ class GUIActor:
             },
         ]
 
-        with torch.inference_mode():
+    def __topk_points(self, image: Image.Image, object: str, topk: int = 3) -> list[tuple[float, float]]:
+        conversation = self.__conversation(image, object)
+
+        with self.__inference(), torch.inference_mode(), tracer.span("guiactor.inference", batch=1):
             pred = inference(
                 conversation,
                 self.__model,
                 self.__tokenizer,
                 self.__data_processor,
                 use_placeholder=True,
-                topk=3,
+                topk=topk,
             )
         
-        px, py = pred["topk_points"][0]
-        return round(px, 4), round(py, 4)
\ No newline at end of file
+        return [(round(px, 4), round(py, 4)) for px, py in pred["topk_points"]]
+
+    def parse_image(self, image: Image.Image, object: str) -> tuple[float, float]:
+        return self.__topk_points(image, object)[0]
+
+    def parse_image_batch(self, image: Image.Image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        if len(objects) == 1:
+            return [self.__topk_points(image, objects[0], topk)]
+        return self.parse_images([(image, objects)], topk)[0]
+
+    def parse_images(self, requests: list[tuple[Image.Image, list[str]]], topk: int = 3) -> list[list[list[tuple[float, float]]]]:
+        """Ground the objects of several (image, objects) requests in one batched forward pass. Each distinct image is preprocessed and run through the vision tower once; its embeddings are copied into every row that asks about it."""
+        pairs = [(image, object) for image, objects in requests for object in objects]
+        conversations = [self.__conversation(image, object) for image, object in pairs]
+        assistant_starter = "<|im_start|>assistant<|recipient|>os\npyautogui.click(<|pointer_start|><|pointer_pad|><|pointer_end|>)"
+        images, unique = {}, []
+        for (image, _), conversation in zip(pairs, conversations):
+            if id(image) not in images:
+                images[id(image)] = len(unique)
+                unique.append(process_vision_info([conversation])[0][0])
+        rows = [images[id(image)] for image, _ in pairs]
+        vision = self.__data_processor.image_processor(images=unique, return_tensors="pt")
+        grids = vision["image_grid_thw"]
+        merge = self.__model.visual.spatial_merge_size
+        tokens = (grids.prod(-1) // merge ** 2).tolist()
+        texts = [
+            (self.__data_processor.apply_chat_template(conversation, tokenize=False, add_generation_prompt=False, chat_template=chat_template) + assistant_starter).replace("<|image_pad|>", "<|image_pad|>" * tokens[index], 1)
+            for conversation, index in zip(conversations, rows)
+        ]
+        inputs = self.__tokenizer(texts, padding=True, return_tensors="pt").to(self.__model.device)
+        image_token_id = self.__tokenizer.encode("<|image_pad|>")[0]
+
+        with self.__inference(), torch.inference_mode(), tracer.span("guiactor.inference", batch=len(pairs), images=len(unique)):
+            pixel_values = vision["pixel_values"].to(self.__model.device, self.__model.visual.dtype)
+            image_embeds = self.__model.visual(pixel_values, grid_thw=grids.to(self.__model.device)).split(tokens)
+            inputs_embeds = self.__model.get_input_embeddings()(inputs["input_ids"])
+            for row, index in enumerate(rows):
+                inputs_embeds[row][inputs["input_ids"][row] == image_token_id] = image_embeds[index].to(inputs_embeds.dtype)
+            outputs = self.__model(
+                **inputs,
+                inputs_embeds=inputs_embeds,
+                image_grid_thw=grids[rows].to(self.__model.device),
+                output_hidden_states=True,
+                use_cache=False,
+            )
+
+        points = []
+        for row, index in enumerate(rows):
+            input_ids = inputs["input_ids"][row]
+            _, n_height, n_width = (grids[index] // merge).tolist()
+            image_states = outputs.hidden_states[0][row][input_ids == image_token_id]
+            pointer_states = outputs.hidden_states[-1][row][input_ids == self.__model.config.pointer_pad_token_id]
+            attn_scores, _ = self.__model.multi_patch_pointer_head(image_states, pointer_states)
+            _, region_points, _, _ = get_prediction_region_point(attn_scores, n_width, n_height, return_all_regions=True, rect_center=False)
+            points.append([(round(px, 4), round(py, 4)) for px, py in region_points[:topk]])
+
+        grouped = []
+        for _, objects in requests:
+            grouped.append(points[:len(objects)])
+            points = points[len(objects):]
+        return grouped
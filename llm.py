@@ -0,0 +1,139 @@
+import asyncio, random, time
+from threading import Lock
+from typing import Any
+import httpx
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+from tracing import tracer
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = float(capacity)
+        self.__updated = time.monotonic()
+        self.__lock = Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller has to wait before using it."""
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= 1
+            return 0.0 if self.__tokens >= 0 else -self.__tokens / self.rate
+
+class LLMClient:
+
+    def __init__(self, requests_per_minute: float = 500, burst: int = 20, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        self.limiter = TokenBucket(requests_per_minute / 60, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.http_client = httpx.Client(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20), timeout=httpx.Timeout(120.0, connect=10.0))
+        self.http_async_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20), timeout=httpx.Timeout(120.0, connect=10.0))
+        self.__lock = Lock()
+        self.stats = {"requests" : 0, "retries" : 0, "failures" : 0, "queue_wait" : 0.0, "backoff_wait" : 0.0, "input_tokens" : 0, "cached_tokens" : 0, "cache_hits" : 0}
+
+    def chat_model(self, model: str, **kwargs) -> ChatOpenAI:
+        """ChatOpenAI on this client's pooled HTTP connections, with SDK retries disabled so that retries are handled and counted here."""
+        return ChatOpenAI(model=model, http_client=self.http_client, http_async_client=self.http_async_client, max_retries=0, **kwargs)
+
+    def __record(self, key: str, value: float = 1) -> None:
+        with self.__lock:
+            self.stats[key] += value
+
+    def __retry_after(self, error: Exception) -> float:
+        if isinstance(error, APIStatusError):
+            headers = error.response.headers
+            try:
+                if "retry-after-ms" in headers:
+                    return float(headers["retry-after-ms"]) / 1000
+                if "retry-after" in headers:
+                    return float(headers["retry-after"])
+            except ValueError:
+                pass
+        return None
+
+    def __delay(self, attempt: int, error: Exception) -> float:
+        retry_after = self.__retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after + random.uniform(0, self.base_delay))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def __usage(self, span: dict, result: Any) -> Any:
+        """Record token usage from the response. Structured output built with `include_raw=True` is unwrapped: usage comes from the raw message and the parsed object is returned."""
+        structured = isinstance(result, dict) and "raw" in result and "parsed" in result
+        usage = getattr(result["raw"] if structured else result, "usage_metadata", None)
+        if usage:
+            span["input_tokens"] = usage.get("input_tokens", 0)
+            span["output_tokens"] = usage.get("output_tokens", 0)
+            span["cached_tokens"] = (usage.get("input_token_details") or {}).get("cache_read", 0)
+            tracer.count("llm_input_tokens", span["input_tokens"])
+            tracer.count("llm_output_tokens", span["output_tokens"])
+            tracer.count("llm_cached_tokens", span["cached_tokens"])
+            tracer.count("llm_cache_hits", span["cached_tokens"] > 0)
+            self.__record("input_tokens", span["input_tokens"])
+            self.__record("cached_tokens", span["cached_tokens"])
+            self.__record("cache_hits", span["cached_tokens"] > 0)
+        if structured:
+            if result.get("parsing_error") is not None:
+                raise result["parsing_error"]
+            return result["parsed"]
+        return result
+
+    def cache_hit_rate(self) -> float:
+        """Share of prompt tokens served from the provider's prompt cache."""
+        return self.stats["cached_tokens"] / self.stats["input_tokens"] if self.stats["input_tokens"] else 0.0
+
+    def __should_retry(self, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            self.__record("failures")
+            return False
+        self.__record("retries")
+        return True
+
+    def invoke(self, runnable: Runnable, input: Any) -> Any:
+        with tracer.span("llm", retries=0, queue_wait=0.0) as span:
+            for attempt in range(self.max_retries + 1):
+                wait = self.limiter.reserve()
+                self.__record("queue_wait", wait)
+                span["queue_wait"] += wait
+                time.sleep(wait)
+                self.__record("requests")
+                try:
+                    return self.__usage(span, runnable.invoke(input))
+                except RETRYABLE_ERRORS as error:
+                    if not self.__should_retry(attempt):
+                        raise
+                    delay = self.__delay(attempt, error)
+                    print(f"{type(error).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                    self.__record("backoff_wait", delay)
+                    span["retries"] += 1
+                    time.sleep(delay)
+
+    async def ainvoke(self, runnable: Runnable, input: Any) -> Any:
+        with tracer.span("llm", retries=0, queue_wait=0.0) as span:
+            for attempt in range(self.max_retries + 1):
+                wait = self.limiter.reserve()
+                self.__record("queue_wait", wait)
+                span["queue_wait"] += wait
+                await asyncio.sleep(wait)
+                self.__record("requests")
+                try:
+                    return self.__usage(span, await runnable.ainvoke(input))
+                except RETRYABLE_ERRORS as error:
+                    if not self.__should_retry(attempt):
+                        raise
+                    delay = self.__delay(attempt, error)
+                    print(f"{type(error).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                    self.__record("backoff_wait", delay)
+                    span["retries"] += 1
+                    await asyncio.sleep(delay)
+
+client = LLMClient()
@@ -0,0 +1,117 @@
+import json, os
+from threading import Lock
+
+from cache import hamming
+from capture import Frame, ScreenCapture, changed_tiles
+from tracing import tracer
+
+class Macro:
+    """A successful trajectory: per step, the tool calls, the coordinates their targets resolved to and the fingerprint and signature of the frame the step started from."""
+
+    def __init__(self, task: str, steps: list[dict], result: str = "", uses: int = 0) -> None:
+        self.task = task
+        self.steps = steps
+        self.result = result
+        self.uses = uses
+
+    def describe(self, count: int = None) -> str:
+        return "; ".join(f"{call['name']}({', '.join(f'{key}={value!r}' for key, value in call['args'].items())})" for step in self.steps[:count] for call in step["calls"])
+
+    def to_dict(self) -> dict:
+        return {"task" : self.task, "steps" : self.steps, "result" : self.result, "uses" : self.uses}
+
+class MacroLibrary:
+    """Macros keyed by task, replayed without the LLM or grounding for as long as every step's frame still matches the one it was recorded on. The fingerprint rules out frames that obviously differ; a match needs at most `max_tiles` changed tiles between the signatures."""
+
+    def __init__(self, path: str = "macros.json", max_distance: int = 5, max_tiles: int = 4, max_variants: int = 4) -> None:
+        self.__path = path
+        self.__max_distance = max_distance
+        self.__max_tiles = max_tiles
+        self.__max_variants = max_variants
+        self.__macros = {}
+        self.__lock = Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                for entry in json.load(file):
+                    self.__macros.setdefault(self.__key(entry["task"]), []).append(Macro(**entry))
+
+    def __key(self, task: str) -> str:
+        return " ".join(task.lower().split())
+
+    def __changed(self, step: dict, fingerprint: int, signature: str) -> int:
+        """Tiles that differ between the frame a step was recorded on and another one, or None when the fingerprints already tell them apart."""
+        if step.get("signature") is None or hamming(step["fingerprint"], fingerprint) > self.__max_distance:
+            return None
+        return changed_tiles(step["signature"], signature)
+
+    def __matches(self, step: dict, fingerprint: int, signature: str) -> bool:
+        changed = self.__changed(step, fingerprint, signature)
+        return changed is not None and changed <= self.__max_tiles
+
+    def __save(self) -> None:
+        if not self.__path:
+            return
+        temporary = f"{self.__path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump([macro.to_dict() for variants in self.__macros.values() for macro in variants], file)
+        os.replace(temporary, self.__path)
+
+    def get(self, task: str, screenshot: Frame) -> Macro:
+        """The recorded variant of this task whose first frame is closest to the current one, if any is close enough."""
+        with self.__lock:
+            variants = [macro for macro in self.__macros.get(self.__key(task), []) if self.__matches(macro.steps[0], screenshot.fingerprint, screenshot.signature)]
+        return min(variants, key=lambda macro: self.__changed(macro.steps[0], screenshot.fingerprint, screenshot.signature), default=None)
+
+    def record(self, task: str, screenshot: Frame, trajectory: list[dict], result: str = "", prefix: list[dict] = []) -> Macro:
+        """Compile a successful run into a macro. `screenshot` is the frame the run started from and `prefix` the steps already replayed before it. The macro stops before the first step whose targets could not be grounded, since its recorded coordinates would be a guess."""
+        steps = list(prefix)
+        for step in trajectory:
+            if step.get("fallback"):
+                break
+            steps.append({**step, "fingerprint" : screenshot.fingerprint, "signature" : screenshot.signature} if step["fingerprint"] is None else step)
+        steps = [step for step in steps if step["calls"]]
+        if not steps:
+            return None
+        macro = Macro(task, steps, result)
+        with self.__lock:
+            variants = [other for other in self.__macros.get(self.__key(task), []) if not self.__matches(other.steps[0], steps[0]["fingerprint"], steps[0]["signature"])]
+            self.__macros[self.__key(task)] = ([macro] + variants)[:self.__max_variants]
+            self.__save()
+        return macro
+
+    def forget(self, task: str) -> None:
+        with self.__lock:
+            self.__macros.pop(self.__key(task), None)
+            self.__save()
+
+    def play(self, macro: Macro, tools: dict, capture: ScreenCapture, mouse, screenshot: Frame) -> tuple[int, Frame]:
+        """Replay the steps of a macro while each frame matches its recording. Returns how many steps ran and the frame now on screen."""
+        with tracer.span("macro", steps=len(macro.steps)) as span:
+            replayed = 0
+            for step in macro.steps:
+                if not self.__matches(step, screenshot.fingerprint, screenshot.signature):
+                    print(f"Macro step {replayed + 1} no longer matches the screen ({self.__changed(step, screenshot.fingerprint, screenshot.signature)} changed tiles), falling back to the agent")
+                    break
+                mouse.seed(screenshot, step["points"])
+                for call in step["calls"]:
+                    print(f"Replaying: {call}")
+                    with tracer.span("tool", tool=call["name"], macro=True):
+                        tools[call["name"]].invoke(call["args"])
+                screenshot = capture.wait_until_stable()
+                replayed += 1
+            span["replayed"] = replayed
+        tracer.count("macro_steps", replayed)
+        if replayed == len(macro.steps):
+            tracer.count("macro_hits")
+            with self.__lock:
+                macro.uses += 1
+                self.__save()
+        else:
+            tracer.count("macro_fallbacks")
+        return replayed, screenshot
+
+    def remaining(self, task: str, macro: Macro, replayed: int) -> str:
+        """The task as given to the agent after a partial replay."""
+        if macro is None or replayed == 0:
+            return task
+        return f"{task}\n\nThe following actions were already performed for this task: {macro.describe(replayed)}. Continue from the current screen."
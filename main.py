@@ -1,3 +1,6 @@
+import time
+start_time = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -5,13 +8,25 @@ import tkinter as tk
 from tkinter import scrolledtext
 import tkinter.font as tkfont
 from threading import Thread
-import sys, base64
-from PIL import ImageGrab
+import asyncio, os, sys
 
+from accessibility import AccessibilityTree, get_provider
 from agent import Agent
+from backends import get_backend
+from capture import ImageEncoder, ScreenCapture
+from llm import client
+from macros import MacroLibrary
+from tracing import tracer
+from verify import ActionVerifier
+from models import ModelRegistry, registry
 from nodes import Nodes
 from windows import Keyboard, Mouse, Screen
 
+BACKEND = "gui_actor"  # "gui_actor_cpu" on machines without a CUDA GPU, or "omni"
+
+event_loop = asyncio.new_event_loop()
+Thread(target=event_loop.run_forever, daemon=True).start()
+
 class ConsoleRedirector:
     def __init__(self, text_widget: scrolledtext.ScrolledText) -> None:
         self.text_widget = text_widget
@@ -26,17 +41,47 @@ class ConsoleRedirector:
         pass
 
 def run_agent(task: str, output_widget: scrolledtext.ScrolledText) -> None:
-    __tools = Mouse().return_tools() + Keyboard().return_tools()
-    __agent = Agent(__tools)
-    screenshot = ImageGrab.grab()
-    screenshot.save("screenshot.jpeg")
-    screenshot.close()
-    with open("screenshot.jpeg", "rb") as image_file:
-        image = base64.b64encode(image_file.read()).decode('utf-8')
-        image_file.close()
+    __recorder = None
+    __models, __llm = registry, client
+    if os.getenv("RECORD_DIR"):
+        from replay import RecordingCapture, RecordingClient, RecordingGrounding, Recorder
+        __recorder = Recorder(os.path.join(os.getenv("RECORD_DIR"), time.strftime("%Y%m%d-%H%M%S")))
+        __recorder.task(task, Screen().get_size())
+        __capture = RecordingCapture(__recorder, get_backend().grab)
+        __models, __llm = ModelRegistry(), RecordingClient(__recorder)
+    else:
+        __capture = ScreenCapture(get_backend().grab)
+    __encoder = ImageEncoder()
+    screenshot = __capture.grab()
     print(f"Starting task: {task}\n")
-    __messages = __agent.graph.invoke({"messages" : Nodes().agent_message(Screen().get_size(), task, image)}, {"recursion_limit" : 100})
-    print(__messages["messages"][-1].content)
+    load_start = time.perf_counter()
+    if __recorder is not None:
+        __models.register(BACKEND, RecordingGrounding(__recorder, registry.get(BACKEND)))
+    registry.get(BACKEND)
+    print(f"Grounding backend ready for task in {time.perf_counter() - load_start:.2f}s\n")
+    __mouse = Mouse(choice=BACKEND, capture=__capture, models=__models, llm=__llm, accessibility=accessibility)
+    __tools = __mouse.return_tools() + Keyboard().return_tools()
+    __macro = macros.get(task, screenshot)
+    __replayed = 0
+    if __macro is not None:
+        print(f"Replaying macro with {len(__macro.steps)} steps\n")
+        __replayed, screenshot = macros.play(__macro, {t.name: t for t in __tools}, __capture, __mouse, screenshot)
+    if __macro is not None and __replayed == len(__macro.steps):
+        print(__macro.result)
+    else:
+        image = __encoder.encode(screenshot.image)
+        __agent = Agent(__tools, capture=__capture, prefetch=__mouse.prefetch, resolve=__mouse.resolved, verifier=ActionVerifier(__mouse, Screen().get_size()), encoder=__encoder, llm=__llm)
+        __messages = asyncio.run_coroutine_threadsafe(__agent.graph.ainvoke({"messages" : Nodes().agent_message(Screen().get_size(), macros.remaining(task, __macro, __replayed), image.base64, image.mime)}, {"recursion_limit" : 100}), event_loop).result()
+        if __recorder is not None:
+            __recorder.finish(__messages["messages"])
+            print(f"Recorded task to {__recorder.directory}")
+        if __agent.succeeded(__messages["messages"]):
+            macros.record(task, screenshot, __agent.trajectory(__messages["messages"]), str(__messages["messages"][-1].content), __macro.steps[:__replayed] if __macro is not None else [])
+        print(__messages["messages"][-1].content)
+    print(f"\n{tracer.report()}")
+    print(f"\nLLM requests: {client.stats['requests']}, retries: {client.stats['retries']}, queue wait: {client.stats['queue_wait']:.1f}s, backoff wait: {client.stats['backoff_wait']:.1f}s, prompt cache: {client.stats['cached_tokens']}/{client.stats['input_tokens']} tokens ({client.cache_hit_rate():.0%}) over {client.stats['cache_hits']} hits")
+    tiers = {tier: tracer.counters().get(f"grounding_tier_{tier}", 0) for tier in ("cache", "accessibility", "vision")}
+    print(f"Grounding tiers: " + ", ".join(f"{tier} {count:.0f} ({count / max(1, sum(tiers.values())):.0%})" for tier, count in tiers.items()) + (f", accessibility hit rate {accessibility.hit_rate():.0%}" if accessibility is not None else ""))
     output_widget.configure(state=tk.NORMAL)
     output_widget.insert(tk.END, "\nTask completed\n")
     run_button.config(state=tk.NORMAL)
@@ -54,6 +99,15 @@ def start_task(task_entry: tk.Entry, output_widget: scrolledtext.ScrolledText) -
     thread.start()
 
 if __name__ == "__main__":
+    tracer.export(os.getenv("TRACE_PATH", "traces.jsonl"))
+    if os.getenv("METRICS_PORT"):
+        tracer.serve(int(os.getenv("METRICS_PORT")))
+    if os.getenv("GROUNDING_SERVER"):
+        registry.connect(BACKEND, os.getenv("GROUNDING_SERVER"))
+    registry.warm(BACKEND)
+    macros = MacroLibrary(os.getenv("MACRO_PATH") or "macros.json")
+    provider = get_provider()
+    accessibility = AccessibilityTree(provider, Screen().get_size()) if provider is not None else None
     root = tk.Tk()
     root.overrideredirect(True)
     root.title("Computer Use Agent")
@@ -109,4 +163,6 @@ if __name__ == "__main__":
     )
     close_button.pack(side=tk.LEFT, padx=5)
 
+    print(f"UI ready in {time.perf_counter() - start_time:.2f}s\n")
+
     root.mainloop()
\ No newline at end of file
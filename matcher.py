@@ -0,0 +1,94 @@
+import math, re
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Callable
+
+TYPE_HINTS = {
+    "icon": {"icon", "button", "logo", "image", "symbol", "checkbox", "toggle", "arrow"},
+    "text": {"text", "label", "link", "title", "heading", "word", "menu", "tab"},
+}
+
+POSITION_HINTS = {
+    "left": (0, 0.0), "right": (0, 1.0),
+    "top": (1, 0.0), "upper": (1, 0.0), "bottom": (1, 1.0), "lower": (1, 1.0),
+}
+
+FILLER = {"the", "a", "an", "on", "in", "at", "of", "to", "for", "with", "corner", "side", "screen", "named", "called", "labeled", "labelled"}
+
+class ElementMatcher:
+    """Ranks parsed screen elements against an object description using token overlap, fuzzy ratio and character-trigram similarity over `content`, plus type and position hints from the description."""
+
+    def __init__(self, threshold: float = 0.8, margin: float = 0.1, top_n: int = 8, embed: Callable[[list[str]], list[list[float]]] = None) -> None:
+        self.threshold = threshold
+        self.margin = margin
+        self.top_n = top_n
+        self.__embed = embed
+
+    def __tokens(self, text: str) -> list[str]:
+        return re.findall(r"\w+", text.lower())
+
+    def __trigrams(self, text: str) -> Counter:
+        text = f"  {' '.join(self.__tokens(text))} "
+        return Counter(text[i:i + 3] for i in range(len(text) - 2))
+
+    def __cosine(self, first, second) -> float:
+        if isinstance(first, Counter):
+            dot = sum(count * second[gram] for gram, count in first.items())
+            norms = math.sqrt(sum(v * v for v in first.values())) * math.sqrt(sum(v * v for v in second.values()))
+        else:
+            dot = sum(a * b for a, b in zip(first, second))
+            norms = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+        return dot / norms if norms else 0.0
+
+    def __hints(self, query: str, vocabulary: set[str] = frozenset()) -> tuple[str, str, list[tuple[int, float]]]:
+        """Core of the query with hint and filler words removed, the type hint and the position hints. Type and position words that occur in some candidate's own text (the "tab" of "Close tab") stay in the core, since stripping them would leave a core that no longer tells those candidates apart."""
+        tokens = self.__tokens(query)
+        kind = next((kind for kind, words in TYPE_HINTS.items() if any(token in words for token in tokens)), None)
+        positions = [POSITION_HINTS[token] for token in tokens if token in POSITION_HINTS]
+        hint_words = (set().union(*TYPE_HINTS.values(), POSITION_HINTS) - vocabulary) | FILLER
+        core = " ".join(token for token in tokens if token not in hint_words) or " ".join(tokens)
+        return core, kind, positions
+
+    def __similarity(self, query: str, content: str, query_vector=None, content_vector=None) -> float:
+        query_tokens, content_tokens = set(self.__tokens(query)), set(self.__tokens(content))
+        if not query_tokens or not content_tokens:
+            return 0.0
+        if query_tokens == content_tokens:
+            return 1.0
+        overlap = len(query_tokens & content_tokens)
+        token = (overlap / len(query_tokens | content_tokens) + overlap / len(query_tokens)) / 2
+        fuzzy = SequenceMatcher(None, " ".join(self.__tokens(query)), " ".join(self.__tokens(content))).ratio()
+        semantic = self.__cosine(query_vector, content_vector) if query_vector is not None else self.__cosine(self.__trigrams(query), self.__trigrams(content))
+        return 0.3 * token + 0.35 * fuzzy + 0.35 * semantic
+
+    def rank(self, query: str, items: dict) -> list[tuple[float, int]]:
+        """(score, element id) pairs, best first."""
+        ids = [id for id, element in items.items() if element.get("content")]
+        core, kind, positions = self.__hints(query, {token for id in ids for token in self.__tokens(items[id]["content"])})
+        vectors = {}
+        if self.__embed is not None and ids:
+            embedded = self.__embed([core] + [items[id]["content"] for id in ids])
+            vectors = {"query": embedded[0], **dict(zip(ids, embedded[1:]))}
+        ranked = []
+        for id in ids:
+            element = items[id]
+            score = max(self.__similarity(core, element["content"], vectors.get("query"), vectors.get(id)), self.__similarity(query, element["content"]))
+            if kind is not None:
+                score += 0.05 if element.get("type") == kind else -0.05
+            for axis, target in positions:
+                centre = (element["bbox"][axis] + element["bbox"][axis + 2]) / 2
+                score += 0.1 * (0.5 - abs(centre - target))
+            ranked.append((score, id))
+        return sorted(ranked, reverse=True)
+
+    def match(self, query: str, items: dict) -> tuple[int, list[tuple[float, int]]]:
+        """Best element id when it clears the threshold and beats the runner-up with different content by the margin, otherwise None, along with the top candidates for escalation."""
+        ranked = self.rank(query, items)
+        candidates = ranked[:self.top_n]
+        if not ranked or ranked[0][0] < self.threshold:
+            return None, candidates
+        best = ranked[0]
+        runner_up = next((score for score, id in ranked[1:] if items[id]["content"].strip().lower() != items[best[1]]["content"].strip().lower()), 0.0)
+        if best[0] - runner_up < self.margin:
+            return None, candidates
+        return best[1], candidates
@@ -0,0 +1,49 @@
+import importlib, time
+from threading import Lock, Thread
+
+class ModelRegistry:
+
+    backends = {
+        "omni": ("omniparser", "OmniParser"),
+        "gui_actor": ("guiactor", "GUIActor"),
+        "gui_actor_cpu": ("guiactor", "GUIActor", {"device": "cpu", "quantization": "int8"}),
+    }
+
+    def __init__(self) -> None:
+        self.__models = {}
+        self.__locks = {name: Lock() for name in self.backends}
+        self.load_times = {}
+
+    def get(self, name: str):
+        if name in self.__models:
+            return self.__models[name]
+        start = time.perf_counter()
+        with self.__locks[name]:
+            if name not in self.__models:
+                module, cls, *options = self.backends[name]
+                self.__models[name] = getattr(importlib.import_module(module), cls)(**(options[0] if options else {}))
+                self.load_times[name] = time.perf_counter() - start
+                print(f"Loaded {name} backend in {self.load_times[name]:.2f}s")
+            else:
+                print(f"Waited {time.perf_counter() - start:.2f}s for {name} backend to finish loading")
+        return self.__models[name]
+
+    def register(self, name: str, model) -> None:
+        self.__models[name] = model
+        self.__locks.setdefault(name, Lock())
+
+    def connect(self, name: str, url: str) -> None:
+        """Use the model held by a running grounding server (`server.py`) instead of loading weights in this process."""
+        from server import RemoteGrounding
+        self.register(name, RemoteGrounding(url, name))
+        print(f"Using {name} backend from grounding server at {url}")
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.__models
+
+    def warm(self, name: str) -> Thread:
+        thread = Thread(target=self.get, args=(name,), daemon=True)
+        thread.start()
+        return thread
+
+registry = ModelRegistry()
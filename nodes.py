@@ -1,10 +1,6 @@
 from langchain_core.messages import SystemMessage, HumanMessage, AnyMessage
 
-class Nodes:
-    def agent_message(self, screen_size: tuple[int, int], task: str, image: str) -> list[AnyMessage]:
-        message = [
-            SystemMessage(
-                content=f"""You are an expert computer user who has to use a computer to perform the given task. Your job is to complete the given task using the mouse and keyboard \
+AGENT_PROMPT = """You are an expert computer user who has to use a computer to perform the given task. Your job is to complete the given task using the mouse and keyboard \
 actions. You can use the mouse to perform the following actions: left, right or middle click, double click, verticle and horizontal scroll. You can use the keyboard to perform the \
 following actions: press a key, type a string, press a key combination. To perform these actions, you have the access to the following tools:
 
@@ -26,26 +22,19 @@ You can call these tools either one at a time or together as well. If you call t
 in the same order.
 
 You will get the initial screenshot of the screen and the task , you have to analyse the screenshot and decide what tools have to be called with what values. Each set of tool calls \
-will also return a screenshot of the screen after performing the action. You can use this screenshot to decide what to do next. The size of the screen of the computer is: \
-{screen_size[0], screen_size[1]}.
+will also return a screenshot of the screen after performing the action. You can use this screenshot to decide what to do next. The size of the screen of the computer is given \
+with the task.
 
 Based on these tools and their functions, first plan out how you will use them to complete the task. Consider the order in which you will call the tools and what steps you have to \
-perform to complete the task. Once you have planned your approach, you can start executing the tools as per your plan. Do not stop until the task is completed."""
-            ),
-            HumanMessage(
-                content=[
-                    {"type" : "text", "text" : f"The task given by the user is: {task}\\n\nAlso, the following is the screenshot of the screen:\n"},
-                    {"type" : "image_url",
-                    "image_url" : {"url" : f"data:image/jpeg;base64,{image}"}},
-                ]
-            )
-        ]
-        return message
-    
-    def mouse_functions(self, screen_object: str, screen_items: dict, screenshot: str) -> list[AnyMessage]:
-        message = [
-            SystemMessage(
-                content=f"""You are an expert computer user who has to find the given object or icon. Your job is to find the given object or icon from the \
+perform to complete the task. Once you have planned your approach, you can start executing the tools as per your plan. Do not stop until the task is completed.
+
+When you stop, reply without calling any tool. Start that reply with "TASK COMPLETE" if the task has been completed, or with "TASK FAILED" followed by the reason if it cannot be \
+completed."""
+
+TASK_COMPLETE = "TASK COMPLETE"
+TASK_FAILED = "TASK FAILED"
+
+MOUSE_PROMPT = """You are an expert computer user who has to find the given object or icon. Your job is to find the given object or icon from the \
                 given json format data and the screenshot of the screen and return the name of the object or icon from the given json format data. Based on the \
                 object to be identified, analyse the screenshot, you would find bounding boxes on all icons and objects on the screen. Each bounding box would \
                 have a number. Find the object you have been asked to identify, analyse the number of the bounding box around that and then analyse the json \
@@ -56,15 +45,35 @@ perform to complete the task. Once you have planned your approach, you can start
                 Do not edit any name, give it as it is, do not remove any special characters or spaces from the name or add any, just return the name as it is \
                 in the json data. Analyse the entire josn data and find the best suited object or icon that matches the given icon or object name. There can me \
                 multiple objects or icons with similar names, give the most relevant one."""
-            ),
+
+class Nodes:
+    """Message builders. The system prompts are fixed strings and every variable part comes after them, so consecutive requests share a prefix the provider can cache."""
+
+    def agent_message(self, screen_size: tuple[int, int], task: str, image: str, mime: str = "image/jpeg") -> list[AnyMessage]:
+        message = [
+            SystemMessage(content=AGENT_PROMPT),
+            HumanMessage(
+                content=[
+                    {"type" : "text", "text" : f"The size of the screen of the computer is: {screen_size[0], screen_size[1]}.\n\nThe task given by the user is: {task}\\n\nAlso, the following is the screenshot of the screen:\n"},
+                    {"type" : "image_url",
+                    "image_url" : {"url" : f"data:{mime};base64,{image}"}},
+                ]
+            )
+        ]
+        return message
+    
+    def mouse_functions(self, screen_object: str, screen_items: dict, screenshot: str, mime: str = "image/jpeg") -> list[AnyMessage]:
+        message = [
+            SystemMessage(content=MOUSE_PROMPT),
             HumanMessage(
-                content=[{"type" : "text", "text" : f"From the following json data, find the {screen_object} and give me the name of the object or icon \
-                corresponding to {screen_object} from the data.\n\nThe data is: {str(screen_items)}\n\nAnd the following is the screenshot of the \
+                content=[{"type" : "text", "text" : f"The json data is: {str(screen_items)}\n\nAnd the following is the screenshot of the \
                 screen containing all the numbered bounding boxes:"},
                 {"type" : "image_url",
-                "image_url" : {"url" : f"data:image/jpeg;base64,{screenshot}"}}
+                "image_url" : {"url" : f"data:{mime};base64,{screenshot}"}},
+                {"type" : "text", "text" : f"From the above json data, find the {screen_object} and give me the name of the object or icon \
+                corresponding to {screen_object} from the data."}
                 ]
             )
         ]
 
-        return message
\ No newline at end of file
+        return message
@@ -1,47 +1,124 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Iterator
+import numpy as np
+import torch
 from PIL import Image
 
-from util.utils import check_ocr_box, get_yolo_model, get_caption_model_processor, get_som_labeled_img
+from util.utils import check_ocr_box, get_caption_model_processor, get_parsed_content_icon, get_yolo_model, int_box_area, predict_yolo, remove_overlap_new
+
+from regions import ElementIndex, ParseStream, changed_regions, label_elements, merge
+from tracing import tracer
 
 class OmniParser:
-    def __init__(self) -> None:
+    def __init__(self, caption_batch_size: int = 32, workers: int = 2, device: str = None, incremental: bool = True, tile: int = 64, max_dirty: float = 0.5) -> None:
         self.__yolo_model = get_yolo_model(model_path='weights/icon_detect/model.pt')
-        self.__caption_model_processor = get_caption_model_processor(model_name="florence2", model_name_or_path="weights/icon_caption_florence")
-        
-    def parse_image(self, image_path: str) -> tuple[dict, str]:
-        image_input = Image.open(image_path)
-        
-        box_overlay_ratio = image_input.size[0] / 3200
-        draw_bbox_config = {
-            'text_scale': 0.8 * box_overlay_ratio,
-            'text_thickness': max(int(2 * box_overlay_ratio), 1),
-            'text_padding': max(int(3 * box_overlay_ratio), 1),
-            'thickness': max(int(3 * box_overlay_ratio), 1),
-        }
-        
-        ocr_bbox_rslt, is_goal_filtered = check_ocr_box(
-            image_input, 
-            display_img=False, 
-            output_bb_format='xyxy', 
-            goal_filtering=None, 
-            easyocr_args={'paragraph': False, 'text_threshold': 0.9}, 
-            use_paddleocr=False
-        )
-        
-        text, ocr_bbox = ocr_bbox_rslt
-        
-        dino_labled_img, label_coordinates, parsed_content_list = get_som_labeled_img(
-            image_input,
-            self.__yolo_model,
-            BOX_TRESHOLD=0.05,
-            output_coord_in_ratio=True,
-            ocr_bbox=ocr_bbox,
-            draw_bbox_config=draw_bbox_config,
-            caption_model_processor=self.__caption_model_processor,
-            ocr_text=text,
-            iou_threshold=0.1,
-            imgsz=640,
-        )
-
-        numbered_parsed_content_list = {i+1 : content for i, content in enumerate(parsed_content_list)}
-        
-        return numbered_parsed_content_list, dino_labled_img
\ No newline at end of file
+        self.__caption_model_processor = get_caption_model_processor(model_name="florence2", model_name_or_path="weights/icon_caption_florence", device=device)
+        self.__caption_batch_size = caption_batch_size
+        self.__pool = ThreadPoolExecutor(max_workers=workers)
+        self.__incremental = incremental
+        self.__tile = tile
+        self.__max_dirty = max_dirty
+        self.__index = ElementIndex()
+        self.__previous = None
+        self.__stream = None
+        self.__lock = Lock()
+
+    def __ocr(self, image_input: Image.Image) -> tuple[list[str], list]:
+        with tracer.span("omniparser.ocr"):
+            (text, ocr_bbox), _ = check_ocr_box(
+                image_input,
+                display_img=False,
+                output_bb_format='xyxy',
+                goal_filtering=None,
+                easyocr_args={'paragraph': False, 'text_threshold': 0.9},
+                use_paddleocr=False
+            )
+        return text, ocr_bbox
+
+    def __detect(self, image_input: Image.Image) -> torch.Tensor:
+        with tracer.span("omniparser.detect"):
+            w, h = image_input.size
+            xyxy, _, _ = predict_yolo(model=self.__yolo_model, image=image_input, box_threshold=0.05, imgsz=640, scale_img=False, iou_threshold=0.1)
+        return xyxy / torch.Tensor([w, h, w, h]).to(xyxy.device)
+
+    def __elements(self, image_input: Image.Image) -> tuple[list[dict], int]:
+        """OCR and icon detection run side by side; returns the merged elements, text first, and the index of the first icon still needing a caption (-1 if none)."""
+        w, h = image_input.size
+        ocr = self.__pool.submit(self.__ocr, image_input)
+        detection = self.__pool.submit(self.__detect, image_input)
+        text, ocr_bbox = ocr.result()
+        xyxy = detection.result()
+
+        ocr_bbox = (torch.tensor(ocr_bbox) / torch.Tensor([w, h, w, h])).tolist() if ocr_bbox else []
+        ocr_bbox_elem = [{'type': 'text', 'bbox': box, 'interactivity': False, 'content': txt, 'source': 'box_ocr_content_ocr'} for box, txt in zip(ocr_bbox, text) if int_box_area(box, w, h) > 0]
+        xyxy_elem = [{'type': 'icon', 'bbox': box, 'interactivity': True, 'content': None} for box in xyxy.tolist() if int_box_area(box, w, h) > 0]
+        elements = sorted(remove_overlap_new(boxes=xyxy_elem, iou_threshold=0.1, ocr_bbox=ocr_bbox_elem), key=lambda element: element['content'] is None)
+        start = next((index for index, element in enumerate(elements) if element['content'] is None), -1)
+        return elements, start
+
+    def __captions(self, elements: list[dict], ids: list[int], start: int, image_source: np.ndarray) -> Iterator[list[int]]:
+        if start < 0:
+            return
+        boxes = torch.tensor([element['bbox'] for element in elements])
+        for first in range(start, len(elements), self.__caption_batch_size):
+            last = min(first + self.__caption_batch_size, len(elements))
+            with tracer.span("omniparser.caption", boxes=last - first):
+                captions = get_parsed_content_icon(boxes[first:last], 0, image_source, self.__caption_model_processor, batch_size=self.__caption_batch_size)
+            for index, caption in zip(range(first, last), captions):
+                elements[index]["content"] = caption
+            yield ids[first:last]
+
+    def __annotate(self, image_input: Image.Image) -> Image.Image:
+        """Labels are the `ElementIndex` ids. They have gaps after incremental updates, and upstream `annotate` draws positional numbers, so the labels are drawn here to keep them equal to the element table keys."""
+        items = self.__index.elements
+        with tracer.span("omniparser.annotate", boxes=len(items)):
+            return label_elements(image_input, items)
+
+    def __regions(self, image_input: Image.Image) -> list[tuple]:
+        """Changed regions since the previous frame as screen ratios, grown to cover every indexed element they touch. None when a full parse is cheaper."""
+        if not self.__incremental or self.__previous is None or self.__previous.size != image_input.size:
+            return None
+        w, h = image_input.size
+        regions = [(left / w, top / h, right / w, bottom / h) for left, top, right, bottom in changed_regions(self.__previous, image_input, self.__tile)]
+        regions = merge(regions + self.__index.stale(regions))
+        if sum((right - left) * (bottom - top) for left, top, right, bottom in regions) > self.__max_dirty:
+            return None
+        return regions
+
+    def __parse_region(self, image_input: Image.Image, region: tuple) -> list[dict]:
+        w, h = image_input.size
+        left, top, right, bottom = int(region[0] * w), int(region[1] * h), int(math.ceil(region[2] * w)), int(math.ceil(region[3] * h))
+        crop = image_input.crop((left, top, right, bottom))
+        elements, start = self.__elements(crop)
+        for _ in self.__captions(elements, list(range(len(elements))), start, np.asarray(crop)):
+            pass
+        scale = ((right - left) / w, (bottom - top) / h)
+        for element in elements:
+            x1, y1, x2, y2 = element['bbox']
+            element['bbox'] = [left / w + x1 * scale[0], top / h + y1 * scale[1], left / w + x2 * scale[0], top / h + y2 * scale[1]]
+        return elements
+
+    def stream(self, image_input: Image.Image) -> ParseStream:
+        image_input = image_input.convert("RGB")
+        with self.__lock:
+            if self.__stream is not None:
+                self.__stream.result()
+            regions = self.__regions(image_input)
+            self.__previous = image_input
+            if regions is None:
+                elements, start = self.__elements(image_input)
+                ids = self.__index.update(elements)
+                pending = self.__captions(elements, ids, start, np.asarray(image_input))
+            else:
+                with tracer.span("omniparser.incremental", regions=len(regions)) as span:
+                    span["dirty_area"] = round(sum((right - left) * (bottom - top) for left, top, right, bottom in regions), 4)
+                    elements = [element for region in regions for element in self.__parse_region(image_input, region)]
+                    self.__index.update(elements, regions)
+                pending = iter(())
+            self.__stream = ParseStream(dict(self.__index.elements), self.__annotate(image_input), pending)
+            return self.__stream
+
+    def parse_image(self, image_input: Image.Image) -> tuple[dict, Image.Image]:
+        return self.stream(image_input).result()
@@ -0,0 +1,151 @@
+import math
+from threading import Lock
+from typing import Iterator
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+PALETTE = [(255, 64, 64), (40, 120, 255), (0, 170, 90), (255, 150, 0), (170, 60, 255), (0, 170, 200), (230, 50, 150), (110, 110, 110)]
+
+def overlaps(first: tuple, second: tuple) -> bool:
+    return first[0] < second[2] and second[0] < first[2] and first[1] < second[3] and second[1] < first[3]
+
+def iou(first: tuple, second: tuple) -> float:
+    width = min(first[2], second[2]) - max(first[0], second[0])
+    height = min(first[3], second[3]) - max(first[1], second[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (first[2] - first[0]) * (first[3] - first[1]) + (second[2] - second[0]) * (second[3] - second[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def merge(boxes: list[tuple]) -> list[tuple]:
+    """Union overlapping boxes until every remaining box is disjoint."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if overlaps(boxes[i], boxes[j]):
+                    first, second = boxes[i], boxes.pop(j)
+                    boxes[i] = (min(first[0], second[0]), min(first[1], second[1]), max(first[2], second[2]), max(first[3], second[3]))
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+def changed_regions(previous: Image.Image, current: Image.Image, tile: int = 64, tolerance: int = 16, margin: int = 1) -> list[tuple[int, int, int, int]]:
+    """Pixel boxes covering the tiles that differ between two frames. Connected dirty tiles are grouped into one box, padded by `margin` tiles."""
+    width, height = current.size
+    if previous.size != current.size:
+        return [(0, 0, width, height)]
+    changed = ImageChops.difference(previous.convert("L"), current.convert("L")).point(lambda value: 255 if value > tolerance else 0)
+    bounds = changed.getbbox()
+    if bounds is None:
+        return []
+
+    dirty = set()
+    for row in range(bounds[1] // tile, (bounds[3] - 1) // tile + 1):
+        for column in range(bounds[0] // tile, (bounds[2] - 1) // tile + 1):
+            if changed.crop((column * tile, row * tile, min(width, (column + 1) * tile), min(height, (row + 1) * tile))).getbbox():
+                dirty.add((column, row))
+
+    columns, rows = math.ceil(width / tile), math.ceil(height / tile)
+    regions = []
+    while dirty:
+        stack = [dirty.pop()]
+        left, top = right, bottom = stack[0]
+        while stack:
+            column, row = stack.pop()
+            left, top, right, bottom = min(left, column), min(top, row), max(right, column), max(bottom, row)
+            for neighbour in ((column + dx, row + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                if neighbour in dirty:
+                    dirty.remove(neighbour)
+                    stack.append(neighbour)
+        left, top = max(0, left - margin), max(0, top - margin)
+        right, bottom = min(columns, right + 1 + margin), min(rows, bottom + 1 + margin)
+        regions.append((left * tile, top * tile, min(width, right * tile), min(height, bottom * tile)))
+    return merge(regions)
+
+def label_elements(image: Image.Image, elements: dict) -> Image.Image:
+    """Copy of the image with every element's box outlined and labeled with its key in `elements`, so the numbers on the image are the keys of the element table sent with it."""
+    width, height = image.size
+    thickness = max(1, width // 1000)
+    padding = max(1, width // 1000)
+    font = ImageFont.load_default(size=max(12, width // 120))
+    labeled = image.convert("RGB")
+    draw = ImageDraw.Draw(labeled)
+    for id, element in elements.items():
+        left, top, right, bottom = element["bbox"][0] * width, element["bbox"][1] * height, element["bbox"][2] * width, element["bbox"][3] * height
+        color = PALETTE[id % len(PALETTE)]
+        draw.rectangle((left, top, right, bottom), outline=color, width=thickness)
+        text = draw.textbbox((0, 0), str(id), font=font)
+        label_width, label_height = text[2] - text[0] + 2 * padding, text[3] - text[1] + 2 * padding
+        label_top = top - label_height if top >= label_height else top
+        draw.rectangle((left, label_top, left + label_width, label_top + label_height), fill=color)
+        draw.text((left + padding - text[0], label_top + padding - text[1]), str(id), fill="white", font=font)
+    return labeled
+
+class ElementIndex:
+    """Persistent table of parsed screen elements whose IDs stay the same for as long as an element stays in place. Boxes are in screen ratios (left, top, right, bottom)."""
+
+    def __init__(self, min_iou: float = 0.5) -> None:
+        self.__min_iou = min_iou
+        self.__next_id = 1
+        self.__lock = Lock()
+        self.elements = {}
+
+    def stale(self, regions: list[tuple]) -> list[tuple]:
+        with self.__lock:
+            return [tuple(element["bbox"]) for element in self.elements.values() if any(overlaps(element["bbox"], region) for region in regions)]
+
+    def update(self, elements: list[dict], regions: list[tuple] = None) -> list[int]:
+        """Replace the elements inside `regions` (everything when None) with `elements`, carrying IDs over from replaced elements of the same type at the same place. Returns the IDs given to `elements`."""
+        with self.__lock:
+            replaced = {id: element for id, element in self.elements.items() if regions is None or any(overlaps(element["bbox"], region) for region in regions)}
+            for id in replaced:
+                del self.elements[id]
+            ids = []
+            for element in elements:
+                candidates = [(iou(element["bbox"], old["bbox"]), id) for id, old in replaced.items() if old["type"] == element["type"]]
+                score, id = max(candidates, default=(0.0, None))
+                if score >= self.__min_iou:
+                    del replaced[id]
+                else:
+                    id = self.__next_id
+                    self.__next_id += 1
+                self.elements[id] = element
+                ids.append(id)
+            return ids
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.elements = {}
+
+class ParseStream:
+    """Parse of one screen whose element boxes and labeled image are ready up front while icon captions arrive batch by batch."""
+
+    def __init__(self, items: dict, labeled: Image.Image, pending: Iterator[list[int]]) -> None:
+        self.items = items
+        self.labeled = labeled
+        self.__pending = pending
+        self.__ready = [number for number, element in items.items() if element["content"] is not None]
+        self.__lock = Lock()
+
+    def __iter__(self) -> Iterator[tuple[int, dict]]:
+        index = 0
+        while True:
+            while index < len(self.__ready):
+                yield self.__ready[index], self.items[self.__ready[index]]
+                index += 1
+            with self.__lock:
+                if index == len(self.__ready):
+                    numbers = next(self.__pending, None)
+                    if numbers is None:
+                        return
+                    self.__ready.extend(numbers)
+
+    def result(self) -> tuple[dict, Image.Image]:
+        for _ in self:
+            pass
+        return self.items, self.labeled
@@ -0,0 +1,312 @@
+import argparse, asyncio, glob, json, os, statistics, time, tracemalloc
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AnyMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from PIL import Image
+from pydantic import BaseModel
+
+from agent import Agent
+from backends import HeadlessBackend
+from capture import Frame, ImageEncoder, ScreenCapture
+from llm import LLMClient, client
+from models import ModelRegistry
+from nodes import Nodes
+from regions import ParseStream
+from tracing import tracer
+from windows import Keyboard, Mouse, Screen
+
+def message_bytes(messages: Any) -> int:
+    if not isinstance(messages, list):
+        return len(str(messages))
+    size = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, list) else [message.content]
+        for part in content:
+            if isinstance(part, str):
+                size += len(part)
+            elif part.get("type") == "text":
+                size += len(part["text"])
+            elif part.get("type") == "image_url":
+                size += len(part["image_url"]["url"])
+    return size
+
+class Recorder:
+    """Writes one task to `directory/trace.jsonl` plus JPEG frames under `directory/frames`. Records the task, frames, LLM requests (size) and responses, grounding outputs and tool calls."""
+
+    def __init__(self, directory: str, quality: int = 90) -> None:
+        self.directory = directory
+        self.__quality = quality
+        os.makedirs(f"{directory}/frames", exist_ok=True)
+        self.__file = open(f"{directory}/trace.jsonl", "w", encoding="utf-8", buffering=1)
+        self.__frames = 0
+        self.__last = None
+        self.__lock = Lock()
+
+    def write(self, kind: str, **fields) -> None:
+        with self.__lock:
+            self.__file.write(json.dumps({"kind" : kind, "time" : time.time(), **fields}, default=str) + "\n")
+
+    def task(self, task: str, size: tuple[int, int]) -> None:
+        self.write("task", task=task, size=list(size))
+
+    def frame(self, frame: Frame, stage: str) -> None:
+        with self.__lock:
+            if self.__last is None or self.__last[0] != frame.fingerprint:
+                path = f"frames/{self.__frames:04d}.jpg"
+                frame.image.save(f"{self.directory}/{path}", format="JPEG", quality=self.__quality)
+                self.__frames += 1
+                self.__last = (frame.fingerprint, path)
+            path = self.__last[1]
+        self.write("frame", stage=stage, file=path, fingerprint=frame.fingerprint)
+
+    def llm(self, input: Any, result: Any) -> None:
+        if isinstance(result, AIMessage):
+            self.write("llm", role="agent", request_bytes=message_bytes(input), content=result.content, tool_calls=result.tool_calls)
+        elif isinstance(result, BaseModel):
+            self.write("llm", role="mouse", request_bytes=message_bytes(input), data=result.model_dump())
+
+    def finish(self, messages: list[AnyMessage]) -> None:
+        calls = {call["id"]: call for message in messages if isinstance(message, AIMessage) for call in message.tool_calls}
+        for message in messages:
+            if isinstance(message, ToolMessage) and message.tool_call_id in calls:
+                content = message.content if isinstance(message.content, str) else message.content[0]["text"]
+                self.write("tool", name=message.name, args=calls[message.tool_call_id]["args"], result=content.split("\n\n")[0])
+        self.write("result", content=messages[-1].content)
+        self.__file.close()
+
+class RecordingCapture(ScreenCapture):
+
+    def __init__(self, recorder: Recorder, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__recorder = recorder
+
+    def grab(self) -> Frame:
+        frame = super().grab()
+        self.__recorder.frame(frame, "grab")
+        return frame
+
+    def wait_until_stable(self, threshold: float = None, timeout: float = None) -> Frame:
+        frame = super().wait_until_stable(threshold, timeout)
+        self.__recorder.frame(frame, "settled")
+        return frame
+
+class RecordingClient:
+    """Forwards to a shared `LLMClient` and records every request and response."""
+
+    def __init__(self, recorder: Recorder, llm: LLMClient = client) -> None:
+        self.__recorder = recorder
+        self.__llm = llm
+
+    def chat_model(self, model: str, **kwargs):
+        return self.__llm.chat_model(model, **kwargs)
+
+    def invoke(self, runnable: Runnable, input: Any) -> Any:
+        result = self.__llm.invoke(runnable, input)
+        self.__recorder.llm(input, result)
+        return result
+
+    async def ainvoke(self, runnable: Runnable, input: Any) -> Any:
+        result = await self.__llm.ainvoke(runnable, input)
+        self.__recorder.llm(input, result)
+        return result
+
+class RecordingGrounding:
+
+    def __init__(self, recorder: Recorder, model) -> None:
+        self.__recorder = recorder
+        self.__model = model
+
+    def parse_image_batch(self, image: Image.Image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        points = self.__model.parse_image_batch(image, objects, topk)
+        self.__recorder.write("grounding", objects=objects, points=points)
+        return points
+
+    def stream(self, image: Image.Image) -> ParseStream:
+        stream = self.__model.stream(image)
+        items, _ = stream.result()
+        self.__recorder.write("parse", items=list(items.items()))
+        return stream
+
+class Trace:
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        with open(f"{directory}/trace.jsonl", encoding="utf-8") as file:
+            self.events = [json.loads(line) for line in file]
+        task = next(event for event in self.events if event["kind"] == "task")
+        self.task, self.size = task["task"], tuple(task["size"])
+        frames = [event for event in self.events if event["kind"] == "frame"]
+        self.frames = [event["file"] for event in frames[:1] + [event for event in frames[1:] if event["stage"] == "settled"]]
+        self.agent = [event for event in self.events if event["kind"] == "llm" and event["role"] == "agent"]
+        self.mouse = [event["data"] for event in self.events if event["kind"] == "llm" and event["role"] == "mouse"]
+        self.points = defaultdict(deque)
+        for event in self.events:
+            if event["kind"] == "grounding":
+                for object, points in zip(event["objects"], event["points"]):
+                    self.points[object].append([tuple(point) for point in points])
+        self.parses = deque({int(id): element for id, element in event["items"]} for event in self.events if event["kind"] == "parse")
+        self.request_bytes = sum(event["request_bytes"] for event in self.events if event["kind"] == "llm")
+
+class ReplayScreen:
+    """Frame source for `HeadlessBackend` that shows the recorded screen before a step until that step's first input event, then the screen recorded after it."""
+
+    def __init__(self, trace: Trace) -> None:
+        self.__frames = [Image.open(f"{trace.directory}/{path}").convert("RGB") for path in trace.frames]
+        self.__step = 0
+        self.__events = 0
+
+    def advance(self, backend: HeadlessBackend) -> None:
+        self.__step += 1
+        self.__events = len(backend.events)
+
+    def __call__(self, backend: HeadlessBackend) -> Image.Image:
+        index = self.__step if len(backend.events) > self.__events else self.__step - 1
+        return self.__frames[max(0, min(index, len(self.__frames) - 1))].copy()
+
+class ReplayModel(BaseChatModel):
+    """Deterministic stand-in for the agent model that returns the recorded responses in order."""
+
+    responses: list = []
+    calls: list = []
+    on_response: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls.append(time.perf_counter())
+        if len(self.calls) > len(self.responses):
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Replay finished"))])
+        response = self.responses[len(self.calls) - 1]
+        if self.on_response is not None:
+            self.on_response()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response["content"], tool_calls=response["tool_calls"]))])
+
+class ReplayClient(LLMClient):
+    """LLM client whose `gpt-5-mini` models answer from the recorded mouse responses."""
+
+    def __init__(self, trace: Trace) -> None:
+        super().__init__()
+        self.__responses = deque(trace.mouse)
+
+    def chat_model(self, model: str, **kwargs):
+        responses = self.__responses
+
+        class Structured:
+            def with_structured_output(self, schema, **kwargs):
+                return RunnableLambda(lambda input: schema(**(responses.popleft() if responses else {"name" : ""})))
+
+        return Structured()
+
+class ReplayGrounding:
+
+    def __init__(self, trace: Trace) -> None:
+        self.__points = trace.points
+        self.__parses = trace.parses
+
+    def parse_image_batch(self, image: Image.Image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        points = []
+        for object in objects:
+            recorded = self.__points.get(object)
+            points.append((recorded.popleft() if len(recorded) > 1 else recorded[0]) if recorded else [(0.5, 0.5)])
+        return points
+
+    def stream(self, image: Image.Image) -> ParseStream:
+        items = self.__parses.popleft() if len(self.__parses) > 1 else (self.__parses[0] if self.__parses else {})
+        return ParseStream(items, image, iter(()))
+
+def replay(directory: str, use_async: bool = True) -> dict:
+    """Drive `Agent`, `Mouse` and `Keyboard` from a recorded trace on a headless screen and return the run's measurements."""
+    trace = Trace(directory)
+    screen = ReplayScreen(trace)
+    backend = HeadlessBackend(size=trace.size, frames=screen)
+    capture = ScreenCapture(backend.grab, settle_timeout=0.5)
+    models = ModelRegistry()
+    choice = "omni" if trace.parses else "gui_actor"
+    models.register(choice, ReplayGrounding(trace))
+    encoder = ImageEncoder()
+    mouse = Mouse(choice=choice, capture=capture, backend=backend, encoder=encoder, models=models, llm=ReplayClient(trace))
+    model = ReplayModel(responses=trace.agent, calls=[], on_response=lambda: screen.advance(backend))
+    agent = Agent(mouse.return_tools() + Keyboard(backend).return_tools(), model=model, capture=capture, prefetch=mouse.prefetch, encoder=encoder)
+
+    start = time.perf_counter()
+    screenshot = capture.grab()
+    image = encoder.encode(screenshot.image)
+    messages = Nodes().agent_message(Screen(backend).get_size(), trace.task, image.base64, image.mime)
+    if use_async:
+        asyncio.run(agent.graph.ainvoke({"messages" : messages}, {"recursion_limit" : 2 * len(trace.agent) + 10}))
+    else:
+        agent.graph.invoke({"messages" : messages}, {"recursion_limit" : 2 * len(trace.agent) + 10})
+    total = time.perf_counter() - start
+    latencies = [(b - a) * 1000 for a, b in zip(model.calls, model.calls[1:])]
+    return {"task" : trace.task, "steps" : sum(1 for response in trace.agent if response["tool_calls"]), "seconds" : total, "step_ms" : statistics.median(latencies) if latencies else 0.0, "recorded_request_kb" : trace.request_bytes / 1024, "events" : len(backend.events)}
+
+def record_headless(directory: str, steps: int) -> None:
+    """Record a scripted task on the headless display, to seed a corpus without a desktop or an API key."""
+    from benchmark import CentreGrounding, ScriptedModel
+    recorder = Recorder(directory)
+    backend = HeadlessBackend()
+    capture = RecordingCapture(recorder, backend.grab)
+    models = ModelRegistry()
+    models.register("gui_actor", RecordingGrounding(recorder, CentreGrounding()))
+    llm = RecordingClient(recorder)
+    mouse = Mouse(choice="gui_actor", capture=capture, backend=backend, models=models, llm=llm)
+    agent = Agent(mouse.return_tools() + Keyboard(backend).return_tools(), model=ScriptedModel(steps=steps, calls=[]), capture=capture, prefetch=mouse.prefetch, llm=llm)
+    recorder.task("scripted headless task", backend.get_size())
+    screenshot = capture.grab()
+    messages = agent.graph.invoke({"messages" : Nodes().agent_message(backend.get_size(), "scripted headless task", screenshot.base64)}, {"recursion_limit" : 2 * steps + 10})
+    recorder.finish(messages["messages"])
+    print(f"Recorded {steps} steps to {directory}")
+
+def max_rss() -> float:
+    """Process-wide resident set high-water mark in MB (includes image buffers that tracemalloc does not see)."""
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_suite(corpus: str, use_async: bool = True, memory: bool = True) -> None:
+    directories = sorted(os.path.dirname(path) for path in glob.glob(f"{corpus}/**/trace.jsonl", recursive=True))
+    print(f"{'task':32} {'steps':>5} {'total s':>8} {'step p50 ms':>11} {'sent KB':>9} {'recorded KB':>11} {'py peak MB':>10} {'rss max MB':>10}")
+    for directory in directories:
+        tracer.reset()
+        if memory:
+            tracemalloc.start()
+        result = replay(directory, use_async)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20 if memory else float("nan")
+        if memory:
+            tracemalloc.stop()
+        sent = tracer.counters().get("llm_request_bytes", 0) / 1024
+        print(f"{result['task'][:32]:32} {result['steps']:>5} {result['seconds']:>8.2f} {result['step_ms']:>11.1f} {sent:>9.1f} {result['recorded_request_kb']:>11.1f} {peak:>10.1f} {max_rss():>10.1f}")
+        print(tracer.report())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record agent runs and replay them offline with a deterministic model and screen.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="Record a scripted task on the headless display")
+    record.add_argument("directory")
+    record.add_argument("--steps", type=int, default=10)
+    run = commands.add_parser("replay", help="Replay one recorded task")
+    run.add_argument("directory")
+    run.add_argument("--sync", action="store_true")
+    suite = commands.add_parser("bench", help="Replay every trace under a corpus directory and report per-stage latency, bytes sent, peak memory and steps per task")
+    suite.add_argument("corpus")
+    suite.add_argument("--sync", action="store_true")
+    suite.add_argument("--no-memory", action="store_true", help="Skip tracemalloc peak tracking, which slows the run")
+    arguments = parser.parse_args()
+    if arguments.command == "record":
+        record_headless(arguments.directory, arguments.steps)
+    elif arguments.command == "replay":
+        print(replay(arguments.directory, not arguments.sync))
+        print(tracer.report())
+    else:
+        run_suite(arguments.corpus, not arguments.sync, not arguments.no_memory)
@@ -0,0 +1,227 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse, asyncio, itertools, json, statistics, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from agent import Agent
+from backends import HeadlessBackend
+from capture import ImageEncoder, ScreenCapture
+from llm import LLMClient, client
+from macros import MacroLibrary
+from models import ModelRegistry, registry
+from nodes import Nodes
+from tracing import tracer
+from verify import ActionVerifier
+from windows import Keyboard, Mouse
+
+class Session:
+    """One isolated desktop: its own virtual display, capture, grounding cache and input tools."""
+
+    def __init__(self, number: int, size: tuple[int, int] = (1920, 1080), choice: str = "gui_actor", models: ModelRegistry = registry, llm: LLMClient = client) -> None:
+        self.number = number
+        self.backend = HeadlessBackend(size=size)
+        self.capture = ScreenCapture(self.backend.grab)
+        self.mouse = Mouse(choice=choice, capture=self.capture, models=models, backend=self.backend, llm=llm)
+        self.tool_list = self.mouse.return_tools() + Keyboard(self.backend).return_tools()
+        self.tools = {t.name: t for t in self.tool_list}
+        self.prefetch = self.mouse.prefetch
+        self.resolve = self.mouse.resolved
+        self.verifier = ActionVerifier(self.mouse, size)
+
+class Job:
+
+    def __init__(self, id: int, task: str) -> None:
+        self.id = id
+        self.task = task
+        self.status = "queued"
+        self.session = None
+        self.result = None
+        self.error = None
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id" : self.id, "task" : self.task, "status" : self.status, "session" : self.session, "result" : self.result, "error" : self.error,
+            "queue_seconds" : None if self.started is None else round(self.started - self.submitted, 3),
+            "run_seconds" : None if self.finished is None else round(self.finished - self.started, 3),
+        }
+
+class Runner:
+    """Runs queued tasks on a pool of sessions. The compiled graph, bound model, LLM client and grounding backends are shared; each session only owns its display and tools."""
+
+    def __init__(self, sessions: int = 4, size: tuple[int, int] = (1920, 1080), choice: str = "gui_actor", models: ModelRegistry = registry, llm: LLMClient = client, model: BaseChatModel = None, recursion_limit: int = 100, macros: MacroLibrary = None) -> None:
+        self.__encoder = ImageEncoder()
+        self.__sessions = [Session(number, size, choice, models, llm) for number in range(sessions)]
+        first = self.__sessions[0]
+        options = {"model" : model} if model is not None else {}
+        self.__agent = Agent(first.tool_list, capture=first.capture, prefetch=first.prefetch, resolve=first.resolve, verifier=first.verifier, encoder=self.__encoder, llm=llm, **options)
+        self.__recursion_limit = recursion_limit
+        self.__macros = macros
+        self.__jobs = {}
+        self.__ids = itertools.count(1)
+        self.__lock = Lock()
+        self.__loop = asyncio.new_event_loop()
+        self.__queue = None
+        self.__workers = []
+        self.__started = time.perf_counter()
+        Thread(target=self.__loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.__start(), self.__loop).result()
+
+    async def __start(self) -> None:
+        self.__queue = asyncio.Queue()
+        self.__workers = [self.__loop.create_task(self.__work(session)) for session in self.__sessions]
+
+    async def __work(self, session: Session) -> None:
+        while True:
+            job = await self.__queue.get()
+            job.status, job.session, job.started = "running", session.number, time.perf_counter()
+            tracer.record("queue_wait", job.started - job.submitted)
+            try:
+                screenshot = await asyncio.to_thread(session.capture.grab)
+                macro, replayed = None, 0
+                if self.__macros is not None:
+                    macro = self.__macros.get(job.task, screenshot)
+                    if macro is not None:
+                        replayed, screenshot = await asyncio.to_thread(self.__macros.play, macro, session.tools, session.capture, session.mouse, screenshot)
+                if macro is not None and replayed == len(macro.steps):
+                    job.status, job.result = "done", macro.result
+                else:
+                    image = await asyncio.to_thread(self.__encoder.encode, screenshot.image)
+                    messages = Nodes().agent_message(session.backend.get_size(), job.task if self.__macros is None else self.__macros.remaining(job.task, macro, replayed), image.base64, image.mime)
+                    state = await self.__agent.graph.ainvoke({"messages" : messages}, {"recursion_limit" : self.__recursion_limit, "configurable" : {"session" : session}})
+                    job.status, job.result = "done", str(state["messages"][-1].content)
+                    if self.__macros is not None and self.__agent.succeeded(state["messages"]):
+                        self.__macros.record(job.task, screenshot, self.__agent.trajectory(state["messages"]), job.result, macro.steps[:replayed] if macro is not None else [])
+                tracer.count("runner_completed")
+            except Exception as error:
+                job.status, job.error = "failed", f"{type(error).__name__}: {error}"
+                tracer.count("runner_failed")
+            job.finished = time.perf_counter()
+            tracer.record("task", job.finished - job.started)
+            self.__queue.task_done()
+
+    def submit(self, task: str) -> Job:
+        with self.__lock:
+            job = Job(next(self.__ids), task)
+            self.__jobs[job.id] = job
+        self.__loop.call_soon_threadsafe(self.__queue.put_nowait, job)
+        return job
+
+    def job(self, id: int) -> Job:
+        return self.__jobs.get(id)
+
+    def join(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.__queue.join(), self.__loop).result()
+
+    async def __stop(self) -> None:
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+
+    def close(self) -> None:
+        """Cancel the workers and wait for them to unwind before stopping the event loop."""
+        asyncio.run_coroutine_threadsafe(self.__stop(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            jobs = list(self.__jobs.values())
+        finished = [job for job in jobs if job.finished is not None]
+        latencies = sorted(job.finished - job.submitted for job in finished)
+        elapsed = time.perf_counter() - self.__started
+        return {
+            "sessions" : len(self.__sessions),
+            "queued" : sum(job.status == "queued" for job in jobs),
+            "running" : sum(job.status == "running" for job in jobs),
+            "done" : sum(job.status == "done" for job in jobs),
+            "failed" : sum(job.status == "failed" for job in jobs),
+            "throughput_per_minute" : round(len(finished) / elapsed * 60, 2),
+            "latency_p50_s" : round(statistics.median(latencies), 3) if latencies else None,
+            "latency_p95_s" : round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+        }
+
+    def serve(self, port: int = 8080, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        runner = self
+
+        class RunnerHandler(BaseHTTPRequestHandler):
+            def __reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                if self.path != "/tasks":
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                tasks = request["tasks"] if "tasks" in request else [request["task"]]
+                self.__reply(202, {"ids" : [runner.submit(task).id for task in tasks]})
+
+            def do_GET(self) -> None:
+                if self.path == "/stats":
+                    self.__reply(200, runner.stats())
+                elif self.path == "/metrics":
+                    body = tracer.prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path.startswith("/tasks/") and self.path[7:].isdigit() and runner.job(int(self.path[7:])):
+                    self.__reply(200, runner.job(int(self.path[7:])).to_dict())
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), RunnerHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run agent tasks from a queue on a pool of headless sessions.")
+    parser.add_argument("tasks", nargs="*", help="Tasks to run")
+    parser.add_argument("--file", help="Text file with one task per line")
+    parser.add_argument("--port", type=int, help="Also accept tasks over HTTP (POST /tasks, GET /tasks/<id>, /stats, /metrics) and keep running")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--backend", default="gui_actor", choices=list(ModelRegistry.backends))
+    parser.add_argument("--macros", metavar="PATH", help="Replay and record macros of successful tasks in this file")
+    parser.add_argument("--scripted", type=int, metavar="STEPS", help="Offline load test: scripted model and stand-in grounding with STEPS steps per task")
+    arguments = parser.parse_args()
+
+    model = None
+    if arguments.scripted:
+        from benchmark import CentreGrounding, ScriptedModel
+        registry.register(arguments.backend, CentreGrounding())
+        model = ScriptedModel(steps=arguments.scripted, calls=[])
+    else:
+        registry.warm(arguments.backend)
+    runner = Runner(arguments.sessions, (arguments.width, arguments.height), arguments.backend, model=model, macros=MacroLibrary(arguments.macros) if arguments.macros else None)
+
+    tasks = list(arguments.tasks)
+    if arguments.file:
+        with open(arguments.file, encoding="utf-8") as file:
+            tasks += [line.strip() for line in file if line.strip()]
+    for task in tasks:
+        runner.submit(task)
+    if arguments.port:
+        runner.serve(arguments.port)
+        print(f"Accepting tasks on http://127.0.0.1:{arguments.port}/tasks")
+        while True:
+            time.sleep(10)
+            print(runner.stats())
+    runner.join()
+    print(json.dumps(runner.stats(), indent=2))
+    print(tracer.report())
+    runner.close()
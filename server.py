@@ -0,0 +1,186 @@
+import argparse, json, queue, time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+from threading import Lock, Thread
+import httpx
+from PIL import Image
+
+from models import ModelRegistry, registry
+from regions import ParseStream
+from tracing import tracer
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Open a block created by another process without handing it to this process's resource tracker, which would unlink it on exit."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(block._name, "shared_memory")
+    except Exception:
+        pass
+    return block
+
+def read_frame(name: str, size: tuple[int, int]) -> Image.Image:
+    block = attach(name)
+    try:
+        return Image.frombytes("RGB", tuple(size), bytes(block.buf[:size[0] * size[1] * 3]))
+    finally:
+        block.close()
+
+def write_frame(name: str, image: Image.Image) -> None:
+    block = attach(name)
+    try:
+        data = image.convert("RGB").tobytes()
+        block.buf[:len(data)] = data
+    finally:
+        block.close()
+
+class Batcher:
+    """Collects concurrent grounding requests for up to `max_wait` seconds (or `max_batch` objects) and runs them as one `parse_images` forward pass."""
+
+    def __init__(self, model, max_batch: int = 8, max_wait: float = 0.01) -> None:
+        self.__model = model
+        self.__max_batch = max_batch
+        self.__max_wait = max_wait
+        self.__queue = queue.Queue()
+        Thread(target=self.__run, daemon=True).start()
+
+    def submit(self, image: Image.Image, objects: list[str], topk: int = 3) -> Future:
+        future = Future()
+        self.__queue.put((image, objects, topk, future))
+        return future
+
+    def __collect(self) -> list[tuple]:
+        batch = [self.__queue.get()]
+        size = len(batch[0][1])
+        deadline = time.perf_counter() + self.__max_wait
+        while size < self.__max_batch:
+            try:
+                request = self.__queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[1])
+        return batch
+
+    def __run(self) -> None:
+        while True:
+            batch = self.__collect()
+            try:
+                with tracer.span("server.batch", requests=len(batch), objects=sum(len(objects) for _, objects, _, _ in batch)):
+                    results = self.__model.parse_images([(image, objects) for image, objects, _, _ in batch], max(topk for _, _, topk, _ in batch))
+                for (_, _, topk, future), points in zip(batch, results):
+                    future.set_result([candidates[:topk] for candidates in points])
+            except Exception as error:
+                for *_, future in batch:
+                    future.set_exception(error)
+
+class GroundingServer:
+    """Local HTTP service that keeps one copy of each grounding model for every agent process on the machine. Frames travel through shared memory; only names and results go over the socket."""
+
+    def __init__(self, backends: list[str] = ["gui_actor"], models: ModelRegistry = registry, host: str = "127.0.0.1", port: int = 8765, max_batch: int = 8, max_wait: float = 0.01) -> None:
+        self.__models = models
+        self.backends = backends
+        self.__batchers = {}
+        for name in backends:
+            model = models.get(name)
+            if hasattr(model, "parse_images"):
+                self.__batchers[name] = Batcher(model, max_batch, max_wait)
+        self.__locks = {name: Lock() for name in backends}
+        self.address = (host, port)
+
+    def ground(self, backend: str, image: Image.Image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        if backend in self.__batchers:
+            return self.__batchers[backend].submit(image, objects, topk).result()
+        with self.__locks[backend]:
+            return self.__models.get(backend).parse_image_batch(image, objects, topk)
+
+    def parse(self, backend: str, image: Image.Image) -> tuple[dict, Image.Image]:
+        with self.__locks[backend]:
+            return self.__models.get(backend).parse_image(image)
+
+    def serve(self) -> ThreadingHTTPServer:
+        server = self
+
+        class GroundingHandler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if request.get("backend") not in server.backends:
+                    self.send_error(404, f"Backend {request.get('backend')} is not served")
+                    return
+                with tracer.span("server.request", path=self.path, backend=request["backend"]):
+                    image = read_frame(request["shm"], request["size"])
+                    if self.path == "/ground":
+                        response = {"points" : server.ground(request["backend"], image, request["objects"], request.get("topk", 3))}
+                    elif self.path == "/parse":
+                        items, labeled = server.parse(request["backend"], image)
+                        write_frame(request["shm"], labeled.resize(image.size))
+                        response = {"items" : list(items.items())}
+                    else:
+                        self.send_error(404)
+                        return
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return ThreadingHTTPServer(self.address, GroundingHandler)
+
+class RemoteGrounding:
+    """Client for `GroundingServer` with the grounding interface `Mouse` uses, so it can be registered in place of an in-process model."""
+
+    def __init__(self, url: str = "http://127.0.0.1:8765", backend: str = "gui_actor") -> None:
+        self.__url = url.rstrip("/")
+        self.__backend = backend
+        self.__http = httpx.Client(timeout=httpx.Timeout(300.0, connect=5.0))
+        self.__block = None
+        self.__lock = Lock()
+
+    def __share(self, image: Image.Image) -> dict:
+        image = image.convert("RGB")
+        size = image.size[0] * image.size[1] * 3
+        if self.__block is None or self.__block.size < size:
+            self.close()
+            self.__block = shared_memory.SharedMemory(create=True, size=size)
+        self.__block.buf[:size] = image.tobytes()
+        return {"backend" : self.__backend, "shm" : self.__block.name, "size" : list(image.size)}
+
+    def __post(self, path: str, request: dict) -> dict:
+        response = self.__http.post(f"{self.__url}{path}", json=request)
+        response.raise_for_status()
+        return response.json()
+
+    def parse_image_batch(self, image: Image.Image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        with self.__lock:
+            response = self.__post("/ground", {**self.__share(image), "objects" : objects, "topk" : topk})
+        return [[tuple(point) for point in points] for points in response["points"]]
+
+    def stream(self, image: Image.Image) -> ParseStream:
+        with self.__lock:
+            request = self.__share(image)
+            response = self.__post("/parse", request)
+            width, height = request["size"]
+            labeled = Image.frombytes("RGB", (width, height), bytes(self.__block.buf[:width * height * 3]))
+        return ParseStream({int(id): element for id, element in response["items"]}, labeled, iter(()))
+
+    def close(self) -> None:
+        if self.__block is not None:
+            self.__block.close()
+            self.__block.unlink()
+            self.__block = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve grounding models to every agent process on this machine.")
+    parser.add_argument("--backends", nargs="+", default=["gui_actor"], choices=list(ModelRegistry.backends))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=8, help="Objects per forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="How long the first request waits for others to join its batch")
+    arguments = parser.parse_args()
+    http_server = GroundingServer(arguments.backends, host=arguments.host, port=arguments.port, max_batch=arguments.max_batch, max_wait=arguments.max_wait_ms / 1000).serve()
+    print(f"Grounding server for {', '.join(arguments.backends)} listening on http://{arguments.host}:{arguments.port}")
+    http_server.serve_forever()
@@ -0,0 +1,41 @@
+from accessibility import AccessibilityTree, MockProvider
+
+def tree() -> tuple[MockProvider, AccessibilityTree]:
+    provider = MockProvider()
+    provider.set_window("editor", (0, 0, 900, 1080), [
+        {"name" : "Save", "role" : "button", "rect" : (100, 100, 200, 140)},
+        {"name" : "Open", "role" : "button", "rect" : (220, 100, 320, 140)},
+        {"name" : "Open", "role" : "button", "rect" : (340, 100, 440, 140)},
+    ])
+    provider.set_window("browser", (1000, 0, 1920, 1080), [{"name" : "Reload", "role" : "button", "rect" : (1100, 100, 1200, 140)}])
+    return provider, AccessibilityTree(provider, (1920, 1080))
+
+def test_hit_returns_the_centre_of_the_control():
+    _, accessibility = tree()
+    assert accessibility.locate("save") == (150, 120)
+    assert accessibility.locate("Reload") == (1150, 120)
+    assert accessibility.hits == 2
+
+def test_ambiguous_name_in_the_front_window_is_a_miss():
+    _, accessibility = tree()
+    assert accessibility.locate("Open") is None
+    assert accessibility.misses == 1
+
+def test_control_hidden_behind_a_front_window_is_dropped():
+    provider, accessibility = tree()
+    provider.set_window("dialog", (50, 50, 400, 400), [{"name" : "OK", "role" : "button", "rect" : (60, 60, 120, 90)}])
+    assert accessibility.locate("Save") is None
+    assert accessibility.locate("OK") == (90, 75)
+
+def test_only_windows_under_changed_regions_are_walked_again():
+    provider, accessibility = tree()
+    accessibility.locate("Save")
+    assert provider.walks == 2
+    accessibility.locate("Reload")
+    assert provider.walks == 2
+    accessibility.invalidate([(1500, 500, 1600, 600)])
+    accessibility.locate("Save")
+    assert provider.walks == 3
+    accessibility.invalidate()
+    accessibility.locate("Save")
+    assert provider.walks == 5
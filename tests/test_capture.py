@@ -0,0 +1,42 @@
+import time
+from PIL import Image
+
+from capture import ScreenCapture
+
+class Screen:
+    """Source whose frame turns black `delay` seconds after `act`."""
+
+    def __init__(self, delay: float = None) -> None:
+        self.delay = delay
+        self.acted = None
+
+    def act(self) -> None:
+        self.acted = time.perf_counter()
+
+    def __call__(self) -> Image.Image:
+        changed = self.acted is not None and self.delay is not None and time.perf_counter() - self.acted >= self.delay
+        return Image.new("RGB", (320, 180), "black" if changed else "white")
+
+def settle(delay: float) -> tuple[float, Image.Image]:
+    screen = Screen(delay)
+    capture = ScreenCapture(screen, settle_interval=0.01, settle_quiet=0.25, settle_after_change=0.03)
+    capture.grab()
+    screen.act()
+    start = time.perf_counter()
+    frame = capture.wait_until_stable()
+    return time.perf_counter() - start, frame.image
+
+def test_change_already_on_screen_settles_after_the_short_window():
+    elapsed, image = settle(0.0)
+    assert image.getpixel((0, 0)) == (0, 0, 0)
+    assert elapsed < 0.2
+
+def test_change_that_starts_late_is_waited_for():
+    elapsed, image = settle(0.15)
+    assert image.getpixel((0, 0)) == (0, 0, 0)
+    assert elapsed < 0.35
+
+def test_unchanged_screen_waits_the_full_quiet_window():
+    elapsed, image = settle(None)
+    assert image.getpixel((0, 0)) == (255, 255, 255)
+    assert elapsed >= 0.25
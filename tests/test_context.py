@@ -0,0 +1,34 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from context import ContextWindow
+
+def screenshot(text: str, size: int = 100) -> HumanMessage:
+    return HumanMessage(content=[{"type" : "text", "text" : text}, {"type" : "image_url", "image_url" : {"url" : "data:image/png;base64," + "A" * size}}])
+
+def test_only_the_latest_screenshots_are_sent_as_images():
+    window = ContextWindow(max_images=2)
+    messages = [SystemMessage(content="system"), screenshot("first"), AIMessage(content="one"), screenshot("second"), AIMessage(content="two"), screenshot("third")]
+    view = window.update(messages)
+    assert view[1].content == "first\n[Screenshot omitted, superseded by a later screenshot]"
+    assert view[3].content == messages[3].content
+    assert view[5].content == messages[5].content
+    assert messages[1].content[1]["type"] == "image_url"
+
+def test_new_messages_are_folded_in_incrementally():
+    window = ContextWindow(max_images=1)
+    messages = [screenshot("first"), AIMessage(content="one")]
+    assert window.update(messages)[0].content == messages[0].content
+    messages += [screenshot("second")]
+    view = window.update(messages)
+    assert len(view) == 3
+    assert view[0].content == "first\n[Screenshot omitted, superseded by a later screenshot]"
+    assert window.bytes == sum(len(part) for part in (view[0].content, "one", "second", messages[2].content[1]["image_url"]["url"]))
+
+def test_oldest_turns_are_dropped_to_stay_under_the_byte_budget():
+    window = ContextWindow(max_images=3, max_bytes=1000)
+    messages = [SystemMessage(content="system"), screenshot("first", 400), AIMessage(content="one"), HumanMessage(content="x" * 700), AIMessage(content="two"), screenshot("third", 400)]
+    view = window.update(messages)
+    assert window.bytes <= 1000
+    assert [message.content for message in view[:2]] == ["system", "first\n[Screenshot omitted, superseded by a later screenshot]"]
+    assert view[2].content == "two"
+    assert view[-1].content == messages[-1].content
@@ -0,0 +1,79 @@
+import json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from openai import RateLimitError
+from pydantic import BaseModel
+
+from llm import LLMClient
+
+class Name(BaseModel):
+    name: str
+
+def test_structured_output_with_raw_records_usage_and_returns_the_parsed_object():
+    llm = LLMClient()
+    raw = AIMessage(content='{"name": "OK"}', usage_metadata={"input_tokens" : 1200, "output_tokens" : 8, "total_tokens" : 1208, "input_token_details" : {"cache_read" : 1024}})
+    result = llm.invoke(RunnableLambda(lambda input: {"raw" : raw, "parsed" : Name(name="OK"), "parsing_error" : None}), "prompt")
+    assert result == Name(name="OK")
+    assert llm.stats["input_tokens"] == 1200
+    assert llm.stats["cached_tokens"] == 1024
+    assert llm.cache_hit_rate() == 1024 / 1200
+
+COMPLETION = {"id" : "chatcmpl-test", "object" : "chat.completion", "created" : 0, "model" : "gpt-5-mini",
+              "choices" : [{"index" : 0, "message" : {"role" : "assistant", "content" : "done"}, "finish_reason" : "stop"}],
+              "usage" : {"prompt_tokens" : 100, "completion_tokens" : 5, "total_tokens" : 105, "prompt_tokens_details" : {"cached_tokens" : 64}}}
+
+@pytest.fixture
+def endpoint():
+    """Fake chat completions endpoint that answers with the queued statuses, then 200."""
+    statuses, requests = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            requests.append(self.path)
+            status = statuses.pop(0) if statuses else 200
+            body = json.dumps(COMPLETION if status == 200 else {"error" : {"message" : "slow down", "type" : "rate_limit_exceeded"}}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "0.2")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", statuses, requests
+    server.shutdown()
+
+def test_rate_limit_is_retried_after_retry_after_and_the_bucket_spaces_requests(endpoint):
+    url, statuses, requests = endpoint
+    statuses.append(429)
+    llm = LLMClient(requests_per_minute=600, burst=1, base_delay=0.01)
+    model = llm.chat_model("gpt-5-mini", base_url=url, api_key="test")
+    assert llm.invoke(model, [HumanMessage(content="hi")]).content == "done"
+    assert llm.invoke(model, [HumanMessage(content="hi")]).content == "done"
+    assert len(requests) == 3
+    assert llm.stats["requests"] == 3
+    assert llm.stats["retries"] == 1
+    assert llm.stats["failures"] == 0
+    assert 0.2 <= llm.stats["backoff_wait"] <= 0.21
+    assert 0.05 < llm.stats["queue_wait"] <= 0.1
+    assert llm.stats["input_tokens"] == 200
+    assert llm.stats["cached_tokens"] == 128
+
+def test_rate_limit_gives_up_after_max_retries(endpoint):
+    url, statuses, requests = endpoint
+    statuses.extend([429, 429, 429])
+    llm = LLMClient(max_retries=2, base_delay=0.01)
+    with pytest.raises(RateLimitError):
+        llm.invoke(llm.chat_model("gpt-5-mini", base_url=url, api_key="test"), [HumanMessage(content="hi")])
+    assert len(requests) == 3
+    assert llm.stats["retries"] == 2
+    assert llm.stats["failures"] == 1
@@ -0,0 +1,46 @@
+from PIL import Image, ImageDraw
+
+from capture import Frame
+from macros import MacroLibrary
+
+def desktop(menu: bool = False, clock: int = 0) -> Frame:
+    image = Image.new("RGB", (1920, 1080), (230, 230, 230))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1920, 40), fill=(40, 40, 40))
+    draw.rectangle((300, 200, 1500, 900), fill="white")
+    if menu:
+        draw.rectangle((300, 40, 520, 300), fill=(250, 250, 250))
+        for row in range(7):
+            draw.text((310, 50 + row * 30), f"Item {row}", fill="black")
+    draw.text((1850, 1060), f"12:0{clock}", fill="black")
+    return Frame(image)
+
+def step(name: str, frame: Frame = None, fallback: bool = False) -> dict:
+    return {"calls" : [{"name" : "click", "args" : {"to_object" : name}}], "points" : {name : (10, 10)}, "fingerprint" : frame and frame.fingerprint, "signature" : frame and frame.signature, "fallback" : fallback}
+
+def test_a_recorded_macro_matches_through_a_clock_change_but_not_an_open_menu():
+    start = desktop()
+    library = MacroLibrary(path=None)
+    macro = library.record("Save  the file", start, [step("File")], "TASK COMPLETE")
+    assert macro.steps[0]["fingerprint"] == start.fingerprint
+    assert library.get("save the file", start) is macro
+    assert library.get("save the file", desktop(clock=1)) is macro
+    assert library.get("save the file", desktop(menu=True)) is None
+    assert library.get("close the file", start) is None
+
+def test_recording_stops_at_the_first_ungrounded_step():
+    start, menu = desktop(), desktop(menu=True)
+    macro = MacroLibrary(path=None).record("save", start, [step("File"), step("Nope", menu, fallback=True), step("Save", start)])
+    assert [call["args"]["to_object"] for entry in macro.steps for call in entry["calls"]] == ["File"]
+
+def test_macros_persist_and_keep_one_variant_per_start_frame(tmp_path):
+    path = str(tmp_path / "macros.json")
+    library = MacroLibrary(path=path)
+    library.record("save", desktop(), [step("File")])
+    library.record("save", desktop(clock=1), [step("Menu")])
+    library.record("save", desktop(menu=True), [step("Item 3")])
+    reloaded = MacroLibrary(path=path)
+    assert reloaded.get("save", desktop()).describe() == "click(to_object='Menu')"
+    assert reloaded.get("save", desktop(menu=True)).describe() == "click(to_object='Item 3')"
+    reloaded.forget("save")
+    assert MacroLibrary(path=path).get("save", desktop()) is None
@@ -0,0 +1,29 @@
+from matcher import ElementMatcher
+
+def items(*contents: str) -> dict:
+    return {id: {"content" : content, "type" : "text", "bbox" : [0.1 * id, 0.1, 0.1 * id + 0.05, 0.15]} for id, content in enumerate(contents)}
+
+def test_exact_text_matches_locally():
+    best, _ = ElementMatcher().match("Settings", items("Settings", "Search", "Sign in"))
+    assert best == 0
+
+def test_hint_words_are_stripped_when_no_candidate_contains_them():
+    best, _ = ElementMatcher().match("the settings icon", items("Settings", "Search", "Sign in"))
+    assert best == 0
+
+def test_hint_words_that_are_part_of_a_candidate_stay_in_the_query():
+    matcher = ElementMatcher()
+    assert matcher.match("close the tab", items("Close", "Close tab"))[0] == 1
+    assert matcher.match("New tab", items("New", "New tab"))[0] == 1
+    assert matcher.match("close", items("Close", "Close tab"))[0] == 0
+
+def test_duplicate_content_is_not_ambiguous_but_near_ties_are():
+    matcher = ElementMatcher()
+    assert matcher.match("Save", items("Save", "Save"))[0] in (0, 1)
+    best, candidates = matcher.match("Save file", items("Save", "Save as"))
+    assert best is None
+    assert {id for _, id in candidates} == {0, 1}
+
+def test_position_hint_breaks_ties():
+    elements = {1 : {"content" : "OK", "type" : "text", "bbox" : [0.05, 0.5, 0.1, 0.55]}, 2 : {"content" : "OK", "type" : "text", "bbox" : [0.9, 0.5, 0.95, 0.55]}}
+    assert ElementMatcher().rank("OK on the right", elements)[0][1] == 2
@@ -0,0 +1,34 @@
+from PIL import Image, ImageDraw
+
+from regions import PALETTE, changed_regions, label_elements
+
+def test_labels_are_drawn_in_the_colour_of_each_element_key():
+    image = Image.new("RGB", (1000, 500), "white")
+    elements = {3 : {"bbox" : [0.1, 0.4, 0.3, 0.6]}, 12 : {"bbox" : [0.6, 0.0, 0.8, 0.2]}}
+    labeled = label_elements(image, elements)
+    assert image.getpixel((200, 200)) == (255, 255, 255)
+    assert labeled.getpixel((200, 200)) == PALETTE[3 % len(PALETTE)]
+    assert labeled.getpixel((700, 100)) == PALETTE[12 % len(PALETTE)]
+    assert labeled.getpixel((101, 195)) == PALETTE[3 % len(PALETTE)]
+    assert labeled.getpixel((601, 1)) == PALETTE[12 % len(PALETTE)]
+
+def test_identical_frames_have_no_changed_regions():
+    image = Image.new("RGB", (640, 320), "white")
+    assert changed_regions(image, image.copy()) == []
+
+def test_a_changed_tile_is_padded_by_the_margin_and_clipped_to_the_frame():
+    previous = Image.new("RGB", (640, 320), "white")
+    current = previous.copy()
+    ImageDraw.Draw(current).rectangle((140, 10, 150, 20), fill="black")
+    assert changed_regions(previous, current) == [(64, 0, 256, 128)]
+    assert changed_regions(previous, current, margin=0) == [(128, 0, 192, 64)]
+
+def test_separate_changes_give_separate_regions():
+    previous = Image.new("RGB", (640, 320), "white")
+    current = previous.copy()
+    ImageDraw.Draw(current).rectangle((10, 10, 20, 20), fill="black")
+    ImageDraw.Draw(current).rectangle((600, 300, 610, 310), fill="black")
+    assert sorted(changed_regions(previous, current, margin=0)) == [(0, 0, 64, 64), (576, 256, 640, 320)]
+
+def test_a_resized_frame_is_one_full_region():
+    assert changed_regions(Image.new("RGB", (640, 320)), Image.new("RGB", (320, 320))) == [(0, 0, 320, 320)]
@@ -0,0 +1,60 @@
+from PIL import Image, ImageDraw
+
+from backends import HeadlessBackend
+from capture import ScreenCapture
+from models import ModelRegistry
+
+class CountingGrounding:
+    """Points every target at the icon and counts the batches it was asked for."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def parse_image_batch(self, image, objects: list[str], topk: int = 3) -> list[list[tuple[float, float]]]:
+        self.calls += 1
+        return [[(0.25, 0.25)] for _ in objects]
+
+def highlighted_after_first_click(backend: HeadlessBackend) -> Image.Image:
+    image = Image.new("RGB", backend.get_size(), "white")
+    clicked = any(event[1] == "mouse" and event[3] for event in backend.events)
+    ImageDraw.Draw(image).rectangle((40, 40, 120, 120), fill="blue" if clicked else "gray")
+    return image
+
+def test_double_click_grounds_once_and_sends_two_clicks_at_one_point(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from windows import Mouse
+    backend = HeadlessBackend(size=(320, 320), frames=highlighted_after_first_click)
+    grounding = CountingGrounding()
+    models = ModelRegistry()
+    models.register("gui_actor", grounding)
+    mouse = Mouse(capture=ScreenCapture(backend.grab), models=models, backend=backend)
+    mouse.double_click("left", "folder icon")
+    assert grounding.calls == 1
+    assert [event[1:] for event in backend.events] == [("move", (80, 80)), ("mouse", "left", False), ("mouse", "left", True), ("mouse", "left", False), ("mouse", "left", True)]
+
+def test_mouse_captures_from_its_own_backend_by_default(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from windows import Mouse
+    backend = HeadlessBackend(size=(320, 320), frames=highlighted_after_first_click)
+    grounding = CountingGrounding()
+    models = ModelRegistry()
+    models.register("gui_actor", grounding)
+    Mouse(models=models, backend=backend).click("left", "folder icon")
+    assert grounding.calls == 1
+    assert backend.events[0][1:] == ("move", (80, 80))
+
+def test_compile_string_holds_shift_only_across_shifted_characters():
+    from windows import Keyboard
+    keyboard = Keyboard(HeadlessBackend())
+    shift = keyboard.keys["shift"]
+    assert keyboard.compile_string("Hi!") == [(shift, False, False), (ord("H"), False, False), (ord("H"), True, False), (shift, True, False),
+                                              (ord("I"), False, False), (ord("I"), True, False),
+                                              (shift, False, False), (0x31, False, False), (0x31, True, False), (shift, True, False)]
+    assert keyboard.compile_string("AB") == [(shift, False, False), (ord("A"), False, False), (ord("A"), True, False), (ord("B"), False, False), (ord("B"), True, False), (shift, True, False)]
+
+def test_compile_string_types_other_characters_as_utf16_units():
+    from windows import Keyboard
+    keyboard = Keyboard(HeadlessBackend())
+    shift = keyboard.keys["shift"]
+    assert keyboard.compile_string("Aé") == [(shift, False, False), (ord("A"), False, False), (ord("A"), True, False), (shift, True, False), (0xE9, False, True), (0xE9, True, True)]
+    assert keyboard.compile_string("😀") == [(0xD83D, False, True), (0xDE00, False, True), (0xD83D, True, True), (0xDE00, True, True)]
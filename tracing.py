@@ -0,0 +1,117 @@
+import json, statistics, time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+class Tracer:
+
+    def __init__(self, max_samples: int = 10000) -> None:
+        self.__durations = defaultdict(lambda: deque(maxlen=max_samples))
+        self.__sums = defaultdict(float)
+        self.__counts = defaultdict(int)
+        self.__counters = defaultdict(float)
+        self.__context = ContextVar("trace_context", default={})
+        self.__file = None
+        self.__lock = Lock()
+
+    def export(self, path: str) -> None:
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+            self.__file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def bind(self, **context) -> None:
+        """Attach run/step identifiers to every span recorded from the current context."""
+        self.__context.set({**self.__context.get(), **context})
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        wall = time.time()
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(name, time.perf_counter() - start, wall, **attributes)
+
+    def record(self, name: str, duration: float, wall: float = None, **attributes) -> None:
+        with self.__lock:
+            self.__durations[name].append(duration)
+            self.__sums[name] += duration
+            self.__counts[name] += 1
+            if self.__file is not None:
+                record = {"span" : name, "start" : wall or time.time() - duration, "duration_ms" : round(duration * 1000, 3), **self.__context.get(), **attributes}
+                self.__file.write(json.dumps(record, default=str) + "\n")
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self.__lock:
+            self.__counters[name] += value
+
+    def counters(self) -> dict[str, float]:
+        with self.__lock:
+            return dict(self.__counters)
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__durations.clear()
+            self.__sums.clear()
+            self.__counts.clear()
+            self.__counters.clear()
+
+    def summary(self) -> dict[str, dict]:
+        with self.__lock:
+            durations = {name: list(values) for name, values in self.__durations.items()}
+            counts = dict(self.__counts)
+        summary = {}
+        for name, values in sorted(durations.items()):
+            quantiles = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+            summary[name] = {"count" : counts[name], "p50_ms" : quantiles[49] * 1000, "p95_ms" : quantiles[94] * 1000, "mean_ms" : statistics.fmean(values) * 1000}
+        return summary
+
+    def report(self) -> str:
+        lines = [f"{'span':24} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10}"]
+        for name, values in self.summary().items():
+            lines.append(f"{name:24} {values['count']:>7} {values['p50_ms']:>10.2f} {values['p95_ms']:>10.2f} {values['mean_ms']:>10.2f}")
+        with self.__lock:
+            lines.extend(f"{name}: {value:g}" for name, value in sorted(self.__counters.items()))
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        lines = ["# TYPE agent_span_duration_seconds summary"]
+        summary = self.summary()
+        with self.__lock:
+            for name, values in summary.items():
+                lines.append(f'agent_span_duration_seconds{{span="{name}",quantile="0.5"}} {values["p50_ms"] / 1000:.6f}')
+                lines.append(f'agent_span_duration_seconds{{span="{name}",quantile="0.95"}} {values["p95_ms"] / 1000:.6f}')
+                lines.append(f'agent_span_duration_seconds_sum{{span="{name}"}} {self.__sums[name]:.6f}')
+                lines.append(f'agent_span_duration_seconds_count{{span="{name}"}} {self.__counts[name]}')
+            for name, value in sorted(self.__counters.items()):
+                metric = "agent_" + name.replace(".", "_").replace("-", "_") + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+tracer = Tracer()
@@ -0,0 +1,91 @@
+import json
+from typing import Literal
+from PIL import Image, ImageChops
+
+from capture import Frame
+from regions import changed_regions
+
+class Verification:
+    """Outcome of the local check of one tool call: whether the screen changed the way the action should have changed it."""
+
+    def __init__(self, tool: str, expected: Literal["local", "screen"] = None, ok: bool = None, changed: float = 0.0, point: tuple[int, int] = None, retry: bool = False, retries: int = 0) -> None:
+        self.tool = tool
+        self.expected = expected
+        self.ok = ok
+        self.changed = changed
+        self.point = point
+        self.retry = retry
+        self.retries = retries
+
+    def to_dict(self) -> dict:
+        result = {"ok" : self.ok, "expected" : f"change around {self.point}" if self.expected == "local" else "change on screen", "changed" : round(self.changed, 4)}
+        if self.retries:
+            result["retries"] = self.retries
+        return result
+
+    def __str__(self) -> str:
+        return f"Verification: {json.dumps(self.to_dict())}"
+
+class ActionVerifier:
+    """Compares the frames before and after an action step around the points it acted on, so actions with no visible effect are caught and retried without another LLM turn. Thin changes such as a blinking caret, and regions that were already changing on their own before the step, do not count as an effect."""
+
+    pointer = {"click" : ["to_object"], "double_click" : ["to_object"], "drag" : ["from_object", "to_object"]}
+    keyboard = {"type_string", "press_key", "key_combination", "scroll"}
+
+    def __init__(self, mouse=None, size: tuple[int, int] = None, radius: int = 40, tolerance: int = 24, min_change: float = 0.01, min_extent: int = 3, tile: int = 16, retries: int = 1) -> None:
+        self.__mouse = mouse
+        self.__size = size
+        self.__radius = radius
+        self.__tolerance = tolerance
+        self.__min_change = min_change
+        self.__min_extent = min_extent
+        self.__tile = tile
+        self.retries = retries
+
+    def __changed(self, before: Image.Image, after: Image.Image, box: tuple[int, int, int, int] = None, ignore: list[tuple[int, int, int, int]] = [], thin: bool = True) -> float:
+        """Fraction of the pixels in `box` (the whole frame when None) that changed, leaving out the `ignore` regions and, unless `thin`, changes no wider or taller than `min_extent` pixels."""
+        left, top = box[:2] if box is not None else (0, 0)
+        if box is not None:
+            before, after = before.crop(box), after.crop(box)
+        changed = ImageChops.difference(before.convert("L"), after.convert("L")).point(lambda value: 255 if value > self.__tolerance else 0)
+        for region in ignore:
+            changed.paste(0, (region[0] - left, region[1] - top, region[2] - left, region[3] - top))
+        total = 0
+        for region in changed_regions(before, after, tile=self.__tile, tolerance=self.__tolerance, margin=0) if not thin else [(0, 0, *changed.size)]:
+            part = changed.crop(region)
+            bounds = part.getbbox()
+            if bounds is not None and (thin or min(bounds[2] - bounds[0], bounds[3] - bounds[1]) > self.__min_extent):
+                total += part.histogram()[255]
+        return total / max(1, changed.size[0] * changed.size[1])
+
+    def __box(self, point: tuple[int, int], image: Image.Image) -> tuple[int, int, int, int]:
+        scale_x, scale_y = (image.size[0] / self.__size[0], image.size[1] / self.__size[1]) if self.__size else (1.0, 1.0)
+        x, y = point[0] * scale_x, point[1] * scale_y
+        return (max(0, int(x - self.__radius)), max(0, int(y - self.__radius)), min(image.size[0], int(x + self.__radius)), min(image.size[1], int(y + self.__radius)))
+
+    def check(self, before: Frame, after: Frame, tool_calls: list[dict], reference: Frame = None) -> list[Verification]:
+        """`reference` is an earlier frame of the same screen with no action in between, e.g. the one the model looked at; whatever changed from it to `before` is changing on its own and is ignored."""
+        if before.image.size != after.image.size:
+            return [Verification(t["name"], ok=True, changed=1.0) for t in tool_calls]
+        ignore = changed_regions(reference.image, before.image, tile=self.__tile, tolerance=self.__tolerance) if reference is not None and reference.image.size == before.image.size else []
+        screen = self.__changed(before.image, after.image, ignore=ignore, thin=False)
+        verifications = []
+        for t in tool_calls:
+            if t["name"] in self.pointer and self.__mouse is not None:
+                points = self.__mouse.resolved([t["args"][key] for key in self.pointer[t["name"]] if key in t["args"]])
+                changes = [(self.__changed(before.image, after.image, self.__box(point, after.image), ignore), point) for point in points.values()]
+                if changes:
+                    changed, point = max(changes)
+                    ok = changed >= self.__min_change or screen > 0
+                    verifications.append(Verification(t["name"], "local", ok, changed, tuple(point), retry=changed == 0 and screen == 0))
+                    continue
+            if t["name"] in self.pointer or t["name"] in self.keyboard:
+                verifications.append(Verification(t["name"], "screen", screen > 0, screen))
+            else:
+                verifications.append(Verification(t["name"]))
+        return verifications
+
+    def forget(self, tool_calls: list[dict]) -> None:
+        """Drop the cached coordinates of the targets of these calls, so the retry grounds them again on the current screen."""
+        if self.__mouse is not None:
+            self.__mouse.forget([t["args"][key] for t in tool_calls for key in self.pointer.get(t["name"], []) if key in t["args"]])
@@ -1,131 +1,229 @@
 from typing import Literal
-import win32api, win32con, win32gui
 from langchain_core.tools import tool, BaseTool
-from PIL import ImageGrab
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
+from accessibility import AccessibilityTree
+from backends import Backend, get_backend
+from cache import FrameMemo, GroundingCache
+from capture import EncodedImage, Frame, ImageEncoder, ScreenCapture
+from llm import LLMClient, client
+from matcher import ElementMatcher
+from models import ModelRegistry, registry
 from nodes import Nodes
-from omniparser import OmniParser
-from guiactor import GUIActor
+from regions import ParseStream, changed_regions
+from tracing import tracer
 
 class ObjectName(BaseModel):
     name: str = Field(description="The name of the object or icon found in the screen")
 
 class Screen:
 
+    def __init__(self, backend: Backend = None):
+        self.__backend = backend or get_backend()
+
     def get_size(self) -> tuple[int, int]:
-        return win32api.GetSystemMetrics(0), win32api.GetSystemMetrics(1)
+        return self.__backend.get_size()
 
     def get_cursor_position(self) -> tuple[int, int]:
-        return win32api.GetCursorPos()
+        return self.__backend.get_cursor_position()
 
     def get_window_rect(self, hwnd: int) -> tuple[int, int, int, int]:
-        rect = win32gui.GetWindowRect(hwnd)
-        return rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1]
+        return self.__backend.get_window_rect(hwnd)
 
 class Mouse:
 
-    def __init__(self, choice: Literal["omni", "gui_actor"] = "gui_actor"):
-        self.__width, self.__height = Screen().get_size()
-        self.__model = ChatOpenAI(model="gpt-5-mini", reasoning_effort="minimal")
+    def __init__(self, choice: Literal["omni", "gui_actor", "gui_actor_cpu"] = "gui_actor", capture: ScreenCapture = None, cache_size: int = 128, models: ModelRegistry = registry, backend: Backend = None, encoder: ImageEncoder = None, llm: LLMClient = client, incremental: bool = True, matcher: ElementMatcher = None, accessibility: AccessibilityTree = None):
+        self.__backend = backend or get_backend()
+        self.__width, self.__height = Screen(self.__backend).get_size()
+        self.__capture = capture or ScreenCapture(self.__backend.grab)
+        self.__cache = GroundingCache(max_size=cache_size)
+        self.__parses = FrameMemo()
+        self.__llm = llm
+        self.__model = None
         self.__choice = choice
-        if self.__choice == "omni":
-            self.__parser = OmniParser()
-            self.__actor = None
-        elif self.__choice == "gui_actor":
-            self.__parser = None
-            self.__actor = GUIActor()
-        self.__counter = 0
-
-    def __analyse_position(self, screen_object: str) -> tuple[int, int]:
-        screenshot = ImageGrab.grab()
-        screenshot.save("screenshot.jpeg")
-        screenshot.close()
-
-        items, image = self.__parser.parse_image("screenshot.jpeg")
-
-        result = self.__model.with_structured_output(ObjectName).invoke(Nodes().mouse_functions(screen_object, items, image))
-        print(f"Object: {screen_object}, Name from data: {result}")
-        
-        for item in items:
-            if items[item]["content"].lower().strip() == result.name.lower().strip():
-                coordinates = items[item]["bbox"]
-                x = coordinates[0] + (coordinates[2] - coordinates[0]) / 2
-                y = coordinates[1] + (coordinates[3] - coordinates[1]) / 2
-                x = int(x * self.__width)
-                y = int(y * self.__height)
-                self.__counter = 0
-                return x, y
-        else:
-            if self.__counter < 3:
-                self.__counter += 1
-                print(f"Object {screen_object} not found, trying again ({self.__counter}/3)")
-                return self.__analyse_position(screen_object)
-            return self.__width//2, self.__height//2
+        self.__models = models
+        self.__encoder = encoder or ImageEncoder(max_long_side=None, max_short_side=None)
+        self.__incremental = incremental
+        self.__previous = None
+        self.__matcher = matcher or ElementMatcher()
+        self.__resolved = {}
+        self.__prefetched = set()
+        self.__accessibility = accessibility
+
+    def __parse(self, screenshot: Frame) -> tuple[ParseStream, EncodedImage]:
+        parsed = self.__parses.get(screenshot.fingerprint)
+        if parsed is None:
+            stream = self.__models.get("omni").stream(screenshot.image)
+            parsed = stream, self.__encoder.encode(stream.labeled)
+            self.__parses.put(screenshot.fingerprint, parsed)
+        return parsed
+
+    def __centre(self, coordinates: list[float]) -> tuple[int, int]:
+        x = coordinates[0] + (coordinates[2] - coordinates[0]) / 2
+        y = coordinates[1] + (coordinates[3] - coordinates[1]) / 2
+        return int(x * self.__width), int(y * self.__height)
+
+    def __analyse_position(self, screen_object: str, screenshot: Frame, retries: int = 3) -> tuple[int, int]:
+        stream, image = self.__parse(screenshot)
+
+        for number, element in stream:
+            if element["content"].lower().strip() == screen_object.lower().strip():
+                print(f"Object: {screen_object}, matched element {number} directly")
+                return self.__centre(element["bbox"])
+
+        with tracer.span("grounding.match") as span:
+            best, candidates = self.__matcher.match(screen_object, stream.items)
+            span["escalated"] = best is None
+        if best is not None:
+            tracer.count("matcher_local")
+            print(f"Object: {screen_object}, matched element {best} ({stream.items[best]['content']}) locally")
+            return self.__centre(stream.items[best]["bbox"])
+        tracer.count("matcher_escalated")
+        items = {id: stream.items[id] for _, id in candidates} or {id: element for id, element in stream.items.items() if element["content"]}
+        if not items:
+            return None
+
+        for attempt in range(retries + 1):
+            tracer.count("llm_request_bytes", len(str(items)) + len(image.base64))
+            if self.__model is None:
+                self.__model = self.__llm.chat_model("gpt-5-mini", reasoning_effort="minimal").with_structured_output(ObjectName, include_raw=True)
+            result = self.__llm.invoke(self.__model, Nodes().mouse_functions(screen_object, items, image.base64, image.mime))
+            print(f"Object: {screen_object}, Name from data: {result}")
+
+            for item in items:
+                if (items[item]["content"] or "").lower().strip() == result.name.lower().strip():
+                    return self.__centre(items[item]["bbox"])
+            if attempt < retries:
+                print(f"Object {screen_object} not found, trying again ({attempt + 1}/{retries})")
+        return None
     
-    def __give_coordinates(self, object: str) -> tuple[int, int]:
-        screenshot = ImageGrab.grab()
-        screenshot.save("screenshot.jpeg")
-        screenshot.close()
+    def __give_coordinates(self, objects: list[str], screenshot: Frame) -> list[tuple[int, int]]:
+        coordinates = []
+        for points in self.__models.get(self.__choice).parse_image_batch(screenshot.image, objects):
+            x, y = points[0]
+            coordinates.append((int(x * self.__width), int(y * self.__height)))
+        return coordinates
+
+    def __sync_frame(self, screenshot: Frame) -> None:
+        """Compare the frame with the previous lookup's in tiles and drop cached coordinates inside the changed tiles (all of them with `incremental=False`). The accessibility tree is marked dirty from the same tiles in both modes, so only windows under a change are walked again."""
+        previous, self.__previous = self.__previous, screenshot
+        if previous is None or previous is screenshot:
+            return
+        scale_x, scale_y = self.__width / screenshot.size[0], self.__height / screenshot.size[1]
+        regions = [(left * scale_x, top * scale_y, right * scale_x, bottom * scale_y) for left, top, right, bottom in changed_regions(previous.image, screenshot.image)]
+        if regions:
+            self.__parses.invalidate()
+            for object in self.__prefetched:
+                self.__cache.discard(object)
+            self.__prefetched.clear()
+        if regions and self.__accessibility is not None:
+            self.__accessibility.invalidate(regions)
+        if regions and not self.__incremental:
+            self.__cache.invalidate()
+        self.__cache.retain(screenshot.fingerprint, lambda point: not any(left <= point[0] < right and top <= point[1] < bottom for left, top, right, bottom in regions))
+        previous.close()
+
+    def __locate(self, objects: list[str], prefetch: bool = False) -> list[tuple[int, int]]:
+        screenshot = self.__capture.grab()
+        self.__sync_frame(screenshot)
+        with tracer.span("grounding", backend=self.__choice, objects=len(objects)) as span:
+            coordinates = [self.__cache.get(screenshot.fingerprint, object) for object in objects]
+            missing = list(dict.fromkeys(object for object, found in zip(objects, coordinates) if found is None))
+            span["cache_misses"] = len(missing)
+            tracer.count("grounding_tier_cache", len(objects) - sum(found is None for found in coordinates))
+            if missing and self.__accessibility is not None:
+                found = {object: self.__accessibility.locate(object) for object in missing}
+                for object, point in found.items():
+                    if point is not None:
+                        self.__cache.put(screenshot.fingerprint, object, point)
+                coordinates = [found.get(object) if point is None else point for object, point in zip(objects, coordinates)]
+                missing = [object for object in missing if found[object] is None]
+                tracer.count("grounding_tier_accessibility", len(found) - len(missing))
+                span["accessibility_hits"] = len(found) - len(missing)
+            if missing:
+                tracer.count("grounding_tier_vision", len(missing))
+                if self.__choice == "omni":
+                    resolved = [self.__analyse_position(object, screenshot) for object in missing]
+                elif self.__choice in ("gui_actor", "gui_actor_cpu"):
+                    resolved = self.__give_coordinates(missing, screenshot)
+                for object, found in zip(missing, resolved):
+                    if found is not None:
+                        self.__cache.put(screenshot.fingerprint, object, found)
+                resolved = dict(zip(missing, resolved))
+                coordinates = [resolved[object] if found is None else found for object, found in zip(objects, coordinates)]
+        for object, found in zip(objects, coordinates):
+            if found is None:
+                self.__resolved.pop(object, None)
+            else:
+                self.__resolved[object] = found
+        coordinates = [(self.__width//2, self.__height//2) if found is None else found for found in coordinates]
+        if prefetch:
+            self.__prefetched.update(objects)
+        else:
+            self.__prefetched.difference_update(objects)
+        return coordinates
+
+    def prefetch(self, objects: list[str]) -> None:
+        """Resolve several targets against the current screen in one pass so that the following tool calls hit the cache. Prefetched points are dropped if the screen changes before a tool call uses them, because an earlier action of the turn may have changed what the description refers to."""
+        if objects:
+            self.__locate(objects, prefetch=True)
 
-        x, y = self.__actor.parse_image("screenshot.jpeg", object)
-        x = int(x * self.__width)
-        y = int(y * self.__height)
-        return x, y
+    def resolved(self, objects: list[str]) -> dict[str, tuple[int, int]]:
+        """The coordinates each of the given targets was last resolved to. Targets that could not be grounded and fell back to the centre of the screen are left out."""
+        return {object: self.__resolved[object] for object in objects if object in self.__resolved}
+
+    def forget(self, objects: list[str]) -> None:
+        """Drop cached coordinates for these targets, so the next lookup grounds them again."""
+        for object in objects:
+            self.__cache.discard(object)
+
+    def seed(self, screenshot: Frame, points: dict[str, tuple[int, int]]) -> None:
+        """Cache known coordinates for the frame on screen, so the next tool calls on these targets skip grounding."""
+        self.__sync_frame(screenshot)
+        for object, point in points.items():
+            self.__cache.put(screenshot.fingerprint, object, tuple(point))
 
     def move(self, to_object: str) -> str:
         """Move the mouse to the given object or icon on the screen"""
-        if self.__choice == "omni":
-            x, y = self.__analyse_position(to_object)
-        elif self.__choice == "gui_actor":
-            x, y = self.__give_coordinates(to_object)
-        win32api.SetCursorPos((x, y))
+        x, y = self.__locate([to_object])[0]
+        with tracer.span("input", action="move"):
+            self.__backend.set_cursor_position((x, y))
         return f"Moved mouse to ({to_object})"
 
     def click(self, button: Literal["left", "right", "middle"], to_object: str) -> str:
         """Click the mouse button at the given x and y coordinates on the screen. The button can be left, right or middle."""
-        if button == "left":
-            self.move(to_object)
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0)
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0)
-        elif button == "right":
-            self.move(to_object)
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTDOWN, 0, 0)
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTUP, 0, 0)
-        elif button == "middle":
+        if button in ("left", "right", "middle"):
             self.move(to_object)
-            win32api.mouse_event(win32con.MOUSEEVENTF_MIDDLEDOWN, 0, 0)
-            win32api.mouse_event(win32con.MOUSEEVENTF_MIDDLEUP, 0, 0)
+            with tracer.span("input", action="click"):
+                self.__backend.mouse_button(button, up=False)
+                self.__backend.mouse_button(button, up=True)
         return f"Clicked {button} button at {to_object}"
     
     def drag(self, from_object: str, to_object: str) -> str:
         """Drag the mouse from the initial position to the final position."""
-        self.move(from_object)
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0)
-        self.move(to_object)
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0)
+        start, end = self.__locate([from_object, to_object])
+        with tracer.span("input", action="drag"):
+            self.__backend.set_cursor_position(start)
+            self.__backend.mouse_button("left", up=False)
+            self.__backend.set_cursor_position(end)
+            self.__backend.mouse_button("left", up=True)
         return f"Dragged mouse from {from_object} to {to_object}"
 
     def scroll(self, direction: Literal["vertical", "horizontal"], delta: int) -> str:
         """Scroll the mouse in the given direction. The direction can be vertical or horizontal. To scroll down, the delta should be negative. To scroll up, the delta should be positive."""
-        if direction == "vertical":
-            win32api.mouse_event(win32con.MOUSEEVENTF_WHEEL, 0, 0, delta, 0)
-        elif direction == "horizontal":
-            win32api.mouse_event(win32con.MOUSEEVENTF_HWHEEL, 0, 0, delta, 0)
+        if direction in ("vertical", "horizontal"):
+            with tracer.span("input", action="scroll"):
+                self.__backend.scroll(direction, delta)
         return f"Scrolled mouse {direction} by {delta} units"
 
     def double_click(self, button: Literal["left", "right", "middle"], to_object: str) -> str:
         """Double click the mouse button at the given x and y coordinates on the screen. The button can be left, right or middle."""
-        if button == "left":
-            self.click("left", to_object)
-            self.click("left", to_object)
-        elif button == "right":
-            self.click("right", to_object)
-            self.click("right", to_object)
-        elif button == "middle":
-            self.click("middle", to_object)
-            self.click("middle", to_object)
+        if button in ("left", "right", "middle"):
+            self.move(to_object)
+            with tracer.span("input", action="double_click"):
+                for _ in range(2):
+                    self.__backend.mouse_button(button, up=False)
+                    self.__backend.mouse_button(button, up=True)
         return f"Double clicked {button} button at {to_object}"
         
     def return_tools(self) -> list[BaseTool]:
@@ -133,9 +231,9 @@ class Mouse:
 
 class Keyboard:
 
-    keys = {"shift" : win32con.VK_SHIFT,
-            "ctrl" : win32con.VK_CONTROL,
-            "alt" : win32con.VK_MENU,
+    keys = {"shift" : 0x10,
+            "ctrl" : 0x11,
+            "alt" : 0x12,
             "windows" : 0x5B,
             "win" : 0x5B,
             "meta" : 0x5B,
@@ -202,6 +300,9 @@ class Keyboard:
             "\"" : ["shift", 0xDE],
             }
 
+    def __init__(self, backend: Backend = None):
+        self.__backend = backend or get_backend()
+
     def press_key(self, key: str) -> str:
         """Press the given key on the keyboard. The key can be any key on the keyboard, including letters, numbers, symbols and function keys."""
         try:
@@ -209,43 +310,71 @@ class Keyboard:
                 if isinstance(self.keys[key], list):
                     self.key_combination(self.keys[key])
                 else:
-                    win32api.keybd_event(self.keys[key], 0, 0, 0)
-                    win32api.keybd_event(self.keys[key], 0, win32con.KEYEVENTF_KEYUP, 0)
+                    with tracer.span("input", action="press_key"):
+                        self.__backend.key(self.keys[key], up=False)
+                        self.__backend.key(self.keys[key], up=True)
             else:
-                win32api.keybd_event(ord(key.upper()), 0, 0, 0)
-                win32api.keybd_event(ord(key.upper()), 0, win32con.KEYEVENTF_KEYUP, 0)
+                with tracer.span("input", action="press_key"):
+                    self.__backend.key(ord(key.upper()), up=False)
+                    self.__backend.key(ord(key.upper()), up=True)
             return f"Pressed key {key}"
         except Exception as e:
             raise e
 
     def key_combination(self, keys: list[str]) -> str:
         """Press the given key combination on the keyboard. The keys can be any key on the keyboard, including letters, numbers, symbols and function keys."""
-        for key in keys:
-            if key in self.keys.keys():
-                win32api.keybd_event(self.keys[key], 0, 0, 0)
-            elif isinstance(key, int):
-                win32api.keybd_event(key, 0, 0, 0)
-            else:
-                win32api.keybd_event(ord(key.upper()), 0, 0, 0)
-        for key in keys[-1::-1]:
-            if key in self.keys.keys():
-                win32api.keybd_event(self.keys[key], 0, win32con.KEYEVENTF_KEYUP, 0)
-            elif isinstance(key, int):
-                win32api.keybd_event(key, 0, win32con.KEYEVENTF_KEYUP, 0)
-            else:
-                win32api.keybd_event(ord(key.upper()), 0, win32con.KEYEVENTF_KEYUP, 0)
+        with tracer.span("input", action="key_combination"):
+            for key in keys:
+                if key in self.keys.keys():
+                    self.__backend.key(self.keys[key], up=False)
+                elif isinstance(key, int):
+                    self.__backend.key(key, up=False)
+                else:
+                    self.__backend.key(ord(key.upper()), up=False)
+            for key in keys[-1::-1]:
+                if key in self.keys.keys():
+                    self.__backend.key(self.keys[key], up=True)
+                elif isinstance(key, int):
+                    self.__backend.key(key, up=True)
+                else:
+                    self.__backend.key(ord(key.upper()), up=True)
         return f"Pressed key combination {str(keys)}"
 
     def type_string(self, text: str) -> str:
         """Type the given string on the keyboard. The string can be any string, including letters, numbers, symbols, spaces and newline character (\\n) and tabs (\\t) as well."""
+        with tracer.span("input", action="type_string", characters=len(text)):
+            self.__backend.send_keys(self.compile_string(text))
+        return f"Typed string {text}"
+
+    def compile_string(self, text: str) -> list[tuple[int, bool, bool]]:
+        shift_code = self.keys["shift"]
+        events = []
+        shift = False
         for char in text:
-            if char.isnumeric() or char.islower():
-                self.press_key(char)
-            elif char.isupper():
-                self.key_combination(["shift", char])
+            code = self.keys.get(char)
+            if code is not None:
+                needs_shift = isinstance(code, list)
+                code = code[-1] if needs_shift else code
+            elif char.isascii() and char.isalnum():
+                code = ord(char.upper())
+                needs_shift = char.isupper()
             else:
-                self.press_key(char)
-        return f"Typed string {text}"
+                if shift:
+                    events.append((shift_code, True, False))
+                    shift = False
+                encoded = char.encode("utf-16-le")
+                units = [int.from_bytes(encoded[index:index + 2], "little") for index in range(0, len(encoded), 2)]
+                events.extend((unit, False, True) for unit in units)
+                events.extend((unit, True, True) for unit in units)
+                continue
+            if needs_shift != shift:
+                events.append((shift_code, shift, False))
+                shift = needs_shift
+            events.append((code, False, False))
+            events.append((code, True, False))
+        if shift:
+            events.append((shift_code, True, False))
+        return events
         
     def return_tools(self) -> list[BaseTool]:
         return [tool(self.press_key), tool(self.key_combination), tool(self.type_string)]
\ No newline at end of file